@@ -0,0 +1,94 @@
+import itertools
+import time
+from types import SimpleNamespace
+
+# Minimal stand-ins for the parts of discord.Interaction the cogs touch, so command callbacks can be
+# driven without a gateway connection. Responses are recorded with timestamps instead of being sent.
+
+_ids = itertools.count(1)
+
+class FakeMessage:
+    def __init__(self, channel_id: int, content=None, **fields):
+        self.id = next(_ids)
+        self.channel = SimpleNamespace(id=channel_id)
+        self.content = content
+        self.fields = fields
+        self.edits = 0
+
+    async def edit(self, **fields):
+        self.edits += 1
+        self.content = fields.get("content", self.content)
+        self.fields.update(fields)
+        return self
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self.acked_at = None # perf_counter() of the initial response (defer or message)
+        self.deferred = False
+        self.content = None
+
+    def is_done(self):
+        return self.acked_at is not None
+
+    def _ack(self):
+        if self.acked_at is not None:
+            raise RuntimeError("Interaction has already been responded to")
+        self.acked_at = time.perf_counter()
+
+    async def defer(self, **kwargs):
+        self._ack()
+        self.deferred = True
+
+    async def send_message(self, content=None, **kwargs):
+        self._ack()
+        self.content = content
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self.messages = []
+        self.last_sent_at = None
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(self._interaction.channel_id, content, **kwargs)
+        self.messages.append(message)
+        self.last_sent_at = time.perf_counter()
+        return message
+
+class FakeInteraction:
+    """
+    One slash command or autocomplete invocation. created_at marks when it "arrived", so the time to
+    acknowledge (Discord allows 3 seconds) is response.acked_at - created_at.
+    """
+    def __init__(self, user, guild=None, channel_id: int = 1):
+        self.id = next(_ids)
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id if guild else None
+        self.channel_id = channel_id
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.created_at = time.perf_counter()
+
+    @property
+    def replies(self):
+        """
+        Every message content sent for the interaction, initial response first.
+        """
+        contents = [self.response.content] if self.response.content is not None else []
+        return contents + [message.content for message in self.followup.messages]
+
+def make_user(user_id: int, administrator: bool = False):
+    return SimpleNamespace(
+        id=user_id,
+        name=f"user{user_id}",
+        display_name=f"User {user_id}",
+        display_avatar=SimpleNamespace(url=f"https://example.invalid/avatars/{user_id}.png"),
+        roles=[],
+        guild_permissions=SimpleNamespace(administrator=administrator),
+    )
+
+def make_guild(guild_id: int, owner_id: int = 0):
+    return SimpleNamespace(id=guild_id, owner_id=owner_id)
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import functools
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from benchmarks.fake_discord import FakeInteraction, make_guild, make_user
+from benchmarks.run_benchmarks import configure_environment
+from benchmarks.stubs import StubServers, disjoint_wallets
+
+# Headless load generator: N simulated users run /link_wallet, /flex, /view_wallet and trait
+# autocomplete through the real cog callbacks, with fake interactions in place of Discord.
+# The RPC and HowRare are the local stand-ins; the database is whatever --database-url points at
+# (use a local Postgres to get production-like numbers). Run: python -m benchmarks.load_test
+
+ACK_DEADLINE = 3.0 # Seconds Discord allows before an interaction must be acknowledged (or deferred)
+GUILD_ID = 1
+ADMIN_ID = 1
+FIRST_USER_ID = 10000
+
+# Weighted mix of what a user does after each think pause
+WORKLOAD = (
+    ("flex", 50),
+    ("flex_filtered", 10),
+    ("autocomplete", 35),
+    ("view_wallet", 5),
+)
+AUTOCOMPLETE_KEYSTROKES = ("", "b", "bl", "blu")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent-user load test for the FlexBot cogs")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 50, 100, 200], help="Concurrent users per stage")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per stage")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between a user's commands (exponential)")
+    parser.add_argument("--wallet-size", type=int, default=20, help="NFTs held by each simulated user")
+    parser.add_argument("--collection-size", type=int, default=10000)
+    parser.add_argument("--rpc-latency", type=float, default=0.05, help="Seconds added before each RPC response")
+    parser.add_argument("--database-url", default=None, help="Defaults to a throwaway SQLite file; point it at a scratch Postgres")
+    parser.add_argument("--admin-sync", action="store_true", help="Run /admin_sync_collection during every stage")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+def percentile(sorted_samples, fraction: float):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(int(len(sorted_samples) * fraction), len(sorted_samples) - 1)]
+
+class StageStats:
+    def __init__(self):
+        self.latencies = defaultdict(list) # operation -> seconds until the callback returned
+        self.acks = [] # seconds from arrival to the initial response
+        self.errors = defaultdict(int)
+        self.loop_lag = []
+
+    def record(self, operation: str, interaction: FakeInteraction, finished_at: float, failed: bool):
+        self.latencies[operation].append(finished_at - interaction.created_at)
+        if interaction.response.acked_at is not None:
+            self.acks.append(interaction.response.acked_at - interaction.created_at)
+        if failed or any(str(reply).startswith(("An error occurred", "Error")) for reply in interaction.replies):
+            self.errors[operation] += 1
+
+    def operations(self):
+        return sum(len(samples) for samples in self.latencies.values())
+
+class Harness:
+    def __init__(self, args, collection_slug: str):
+        from cogs.admin import Admin
+        from cogs.flex import Flex
+        from cogs.wallet import Wallet
+
+        self.args = args
+        self.collection_slug = collection_slug
+        self.flex = Flex(None)
+        self.wallet = Wallet(None)
+        self.admin = Admin(None)
+        self.guild = make_guild(GUILD_ID, owner_id=ADMIN_ID)
+        self.admin_user = make_user(ADMIN_ID, administrator=True)
+        # Command callbacks are plain functions taking the cog first
+        self.link_wallet = functools.partial(Wallet.link_wallet.callback, self.wallet)
+        self.view_wallet = functools.partial(Wallet.view_wallet.callback, self.wallet)
+        self.run_flex = functools.partial(Flex.flex.callback, self.flex)
+        self.sync_collection = functools.partial(Admin.admin_sync_collection.callback, self.admin)
+        self.cache_stats = functools.partial(Admin.admin_cache_stats.callback, self.admin)
+
+    async def invoke(self, stats: StageStats, operation: str, user, callback, *args, **kwargs):
+        """
+        Dispatches a callback as its own task, like the gateway does, and records how long it took.
+        """
+        interaction = FakeInteraction(user, self.guild)
+        task = asyncio.create_task(callback(interaction, *args, **kwargs))
+        failed = False
+        try:
+            result = await task
+        except Exception:
+            failed = True
+            result = None
+        stats.record(operation, interaction, time.perf_counter(), failed)
+        return result
+
+    async def run_user(self, stats: StageStats, user, wallet: str, deadline: float, rng: random.Random):
+        operations = [name for name, _ in WORKLOAD]
+        weights = [weight for _, weight in WORKLOAD]
+        await self.invoke(stats, "link_wallet", user, self.link_wallet, wallet)
+
+        while True:
+            await asyncio.sleep(rng.expovariate(1 / self.args.think_time) if self.args.think_time > 0 else 0)
+            if time.perf_counter() >= deadline:
+                return
+            operation = rng.choices(operations, weights)[0]
+            if operation == "flex":
+                await self.invoke(stats, operation, user, self.run_flex)
+            elif operation == "flex_filtered":
+                choices = await self.invoke(stats, "autocomplete", user, self.flex.trait_autocomplete, "")
+                trait_filter = choices[0].value if choices else None
+                await self.invoke(stats, operation, user, self.run_flex, trait_filter=trait_filter)
+            elif operation == "autocomplete":
+                for current in AUTOCOMPLETE_KEYSTROKES:
+                    await self.invoke(stats, operation, user, self.flex.trait_autocomplete, current)
+            else:
+                await self.invoke(stats, operation, user, self.view_wallet)
+
+    async def run_stage(self, users: int):
+        stats = StageStats()
+        rng = random.Random(self.args.seed + users)
+        wallets = disjoint_wallets([self.args.wallet_size] * users)
+        lag_task = asyncio.create_task(monitor_loop_lag(stats.loop_lag))
+        admin_task = None
+        if self.args.admin_sync:
+            admin_task = asyncio.create_task(self.invoke(stats, "admin_sync_collection", self.admin_user, self.sync_collection))
+
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        await asyncio.gather(*(
+            self.run_user(stats, make_user(FIRST_USER_ID + i), wallet, deadline, random.Random(rng.random()))
+            for i, wallet in enumerate(wallets)
+        ))
+        elapsed = time.perf_counter() - started
+        if admin_task is not None:
+            await admin_task
+        lag_task.cancel()
+        return stats, elapsed
+
+    async def cache_report(self):
+        """
+        The /admin_cache_stats reply, with the markdown stripped.
+        """
+        interaction = FakeInteraction(self.admin_user, self.guild)
+        await self.cache_stats(interaction)
+        return interaction.response.content.replace("**", "")
+
+async def monitor_loop_lag(samples: list, interval: float = 0.05):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(loop.time() - expected, 0.0))
+
+def print_stage(users: int, stats: StageStats, elapsed: float):
+    operations = stats.operations()
+    acks = sorted(stats.acks)
+    lag = sorted(stats.loop_lag)
+    missed = sum(1 for ack in acks if ack > ACK_DEADLINE)
+    print(f"\n{users} users: {operations} operations in {elapsed:.1f}s ({operations / elapsed:.1f} ops/s)")
+    for operation, samples in sorted(stats.latencies.items()):
+        samples = sorted(samples)
+        print(
+            f"  {operation:<22} n={len(samples):<6} p50={percentile(samples, 0.5) * 1000:8.1f}ms "
+            f"p95={percentile(samples, 0.95) * 1000:8.1f}ms p99={percentile(samples, 0.99) * 1000:8.1f}ms "
+            f"errors={stats.errors.get(operation, 0)}"
+        )
+    print(
+        f"  {'ack (initial response)':<22} n={len(acks):<6} p50={percentile(acks, 0.5) * 1000:8.1f}ms "
+        f"p95={percentile(acks, 0.95) * 1000:8.1f}ms p99={percentile(acks, 0.99) * 1000:8.1f}ms "
+        f"over {ACK_DEADLINE:.0f}s={missed}"
+    )
+    print(
+        f"  {'event loop lag':<22} n={len(lag):<6} p50={percentile(lag, 0.5) * 1000:8.1f}ms "
+        f"p95={percentile(lag, 0.95) * 1000:8.1f}ms p99={percentile(lag, 0.99) * 1000:8.1f}ms "
+        f"max={(lag[-1] if lag else 0.0) * 1000:.1f}ms"
+    )
+
+async def main():
+    args = parse_args()
+    collection_slug = f"bench_{args.collection_size}"
+    stubs = await StubServers(collection_slug, rpc_latency=args.rpc_latency).start()
+
+    temp_dir = None
+    database_url = args.database_url
+    if not database_url:
+        temp_dir = tempfile.TemporaryDirectory()
+        database_url = f"sqlite:///{os.path.join(temp_dir.name, 'load.db')}"
+    configure_environment(stubs, database_url)
+
+    from shared import repository
+    from shared.collection_sync import sync_collection
+    from shared.database import dispose_engine, init_db
+    from shared.http_client import close_http_session
+    from shared.ownership_writer import ownership_writer
+    from shared.sync_scheduler import sync_scheduler
+
+    print(f"Stand-ins on {stubs.base_url}; database {database_url}")
+    if database_url.startswith("sqlite"):
+        print("Note: SQLite serializes writes; use --database-url with a local Postgres for production-like numbers.")
+    try:
+        init_db()
+        if await repository.count_collection_nfts(collection_slug) < args.collection_size:
+            print(f"Syncing {collection_slug} from the HowRare stand-in...")
+            await sync_collection(collection_slug)
+        ownership_writer.start()
+        # Workers only: /admin_sync_collection queues on the scheduler, the periodic schedule stays off
+        sync_scheduler.start(schedule=False)
+
+        harness = Harness(args, collection_slug)
+        for users in args.users:
+            stats, elapsed = await harness.run_stage(users)
+            print_stage(users, stats, elapsed)
+
+        await ownership_writer.stop()
+        print(f"\n{await harness.cache_report()}")
+    finally:
+        await sync_scheduler.stop()
+        await ownership_writer.stop()
+        await close_http_session()
+        await stubs.stop()
+        repository.shutdown_db_executor()
+        dispose_engine()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+from benchmarks.stubs import StubServers, disjoint_wallets
+
+# Offline benchmarks for the sync and /flex hot paths.
+# HowRare and the DAS RPC are replaced by the local stand-ins in benchmarks/stubs.py, and the bot's
+# modules are imported only after their environment points at them, so nothing leaves the machine.
+# Run from the repository root: python -m benchmarks.run_benchmarks
+
+BENCH_DISCORD_ID = 1000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline FlexBot benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Synthetic collection sizes to sync")
+    parser.add_argument("--wallet-sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 3000], help="NFTs held by the synthetic wallets")
+    parser.add_argument("--iterations", type=int, default=20, help="Repetitions per fetch_nfts/autocomplete case")
+    parser.add_argument("--howrare-latency", type=float, default=0.0, help="Seconds added before each HowRare response")
+    parser.add_argument("--rpc-latency", type=float, default=0.0, help="Seconds added before each RPC response")
+    parser.add_argument("--database-url", default=None, help="Defaults to a throwaway SQLite file")
+    parser.add_argument("--full-download", action="store_true", help="Also time the non-streaming (full download) sync")
+    return parser.parse_args()
+
+def configure_environment(stubs: StubServers, database_url: str):
+    """
+    Points the bot's modules at the stand-ins. Must run before anything from shared/ or cogs/ is imported.
+    """
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["HOWRARE_API_BASE"] = stubs.howrare_url
+    os.environ["SOLANA_RPC_URL"] = stubs.rpc_url
+    os.environ["SOLANA_COLLECTION_ADDRESSES"] = ""
+    os.environ["HOWRARE_COLLECTION"] = stubs.rpc_collection
+    os.environ["RPC_REQUESTS_PER_SECOND"] = "0"
+    os.environ["IMAGE_CACHE_DIR"] = ""
+    os.environ["METRICS_PORT"] = "0"
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+    }
+
+def report(name: str, samples, extra: str = ""):
+    stats = summarize(samples)
+    print(
+        f"  {name:<40} n={stats['n']:<6} mean={stats['mean'] * 1000:9.3f}ms "
+        f"p50={stats['p50'] * 1000:9.3f}ms p95={stats['p95'] * 1000:9.3f}ms {extra}"
+    )
+
+async def timed(coro_func, *args, **kwargs):
+    started = time.perf_counter()
+    result = await coro_func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+async def bench_sync(sizes, streaming_modes):
+    from shared.collection_sync import sync_collection
+
+    print("Collection sync (HowRare stand-in -> DB)")
+    for size in sizes:
+        collection_slug = f"bench_{size}"
+        for streaming in streaming_modes:
+            mode = "stream" if streaming else "full"
+            # First run inserts everything, the second finds every item unchanged
+            for run in ("insert", "unchanged"):
+                elapsed, stats = await timed(sync_collection, collection_slug, streaming=streaming)
+                report(f"{collection_slug} {mode} {run}", [elapsed], f"{stats['processed'] / elapsed:,.0f} items/s")
+            if streaming and len(streaming_modes) > 1:
+                # Start the full-download run from an empty collection too
+                await _delete_collection(collection_slug)
+
+async def _delete_collection(collection_slug: str):
+    from sqlalchemy import delete
+    from shared.database import FlexHolderStats, FlexNFT, FlexNFTTrait, get_session
+    from shared.repository import run_db
+
+    def _delete():
+        session = get_session()
+        try:
+            mints = session.query(FlexNFT.mint).filter(FlexNFT.collection_slug == collection_slug)
+            session.execute(delete(FlexNFTTrait).where(FlexNFTTrait.mint.in_(mints.scalar_subquery())))
+            session.execute(delete(FlexNFT).where(FlexNFT.collection_slug == collection_slug))
+            session.execute(delete(FlexHolderStats).where(FlexHolderStats.collection_slug == collection_slug))
+            session.commit()
+        finally:
+            session.close()
+
+    await run_db(_delete)
+
+async def bench_fetch_nfts(collection_slug: str, wallet_sizes, iterations: int):
+    from cogs import flex as flex_module
+    from shared.asset_cache import asset_cache
+    from shared.ownership_writer import ownership_writer
+
+    print("Flex.fetch_nfts")
+    cog = flex_module.Flex(None)
+    fresh_max_age = flex_module.OWNERSHIP_MAX_STALENESS
+    for wallet_size, wallet in zip(wallet_sizes, disjoint_wallets(wallet_sizes)):
+        # Claim the wallet's NFTs once so later runs measure the steady state, not first-time writes
+        flex_module.OWNERSHIP_MAX_STALENESS = 0
+        await cog.fetch_nfts(wallet, collection_slug)
+        await ownership_writer.flush()
+
+        live = []
+        for _ in range(iterations):
+            asset_cache.invalidate_wallet(wallet)
+            elapsed, nfts = await timed(cog.fetch_nfts, wallet, collection_slug)
+            live.append(elapsed)
+        report(f"{wallet_size} NFTs, live RPC + reconcile", live, f"({len(nfts)} returned)")
+
+        await ownership_writer.flush()
+        flex_module.OWNERSHIP_MAX_STALENESS = max(fresh_max_age, 3600)
+        fresh = []
+        for _ in range(iterations):
+            elapsed, nfts = await timed(cog.fetch_nfts, wallet, collection_slug)
+            fresh.append(elapsed)
+        report(f"{wallet_size} NFTs, fresh DB path", fresh, f"({len(nfts)} returned)")
+    flex_module.OWNERSHIP_MAX_STALENESS = fresh_max_age
+
+async def bench_trait_autocomplete(wallet_sizes, iterations: int):
+    from cogs.flex import Flex
+    from shared import repository
+    from shared.trait_index import trait_index_cache
+
+    print("Flex.trait_autocomplete")
+    cog = Flex(None)
+    interaction = SimpleNamespace(user=SimpleNamespace(id=BENCH_DISCORD_ID), guild_id=None)
+    queries = ["", "b", "Hat: C", "laser"]
+    for wallet_size, wallet in zip(wallet_sizes, disjoint_wallets(wallet_sizes)):
+        await repository.set_wallet(BENCH_DISCORD_ID, wallet)
+
+        cold, warm = [], []
+        for i in range(iterations):
+            trait_index_cache.invalidate_wallet(wallet)
+            elapsed, _ = await timed(cog.trait_autocomplete, interaction, queries[i % len(queries)])
+            cold.append(elapsed)
+        for i in range(iterations):
+            elapsed, choices = await timed(cog.trait_autocomplete, interaction, queries[i % len(queries)])
+            warm.append(elapsed)
+        report(f"{wallet_size} NFTs, cold index", cold)
+        report(f"{wallet_size} NFTs, warm index", warm, f"({len(choices)} choices)")
+
+def bench_rarity_info(iterations: int = 100000):
+    from benchmarks.stubs import make_items
+    from shared.rarity_config import get_rarity_info
+
+    print("get_rarity_info")
+    items = make_items("rarity_1000", 1000)
+    items[0]["attributes"].append({"name": "Signed by haizeel", "value": "true"})
+    for collection_slug in ("the_growerz", "midevils", "unconfigured"):
+        started = time.perf_counter()
+        for i in range(iterations):
+            item = items[i % len(items)]
+            get_rarity_info(item["rank"], item["attributes"], collection_slug)
+        elapsed = time.perf_counter() - started
+        print(f"  {collection_slug:<40} {iterations} calls in {elapsed * 1000:.1f}ms ({elapsed / iterations * 1e9:,.0f}ns/call)")
+
+async def main():
+    args = parse_args()
+    # The RPC wallets are drawn from the smallest synced collection, so every fetched mint exists in the DB
+    collection_slug = f"bench_{min(args.sizes)}"
+    stubs = await StubServers(collection_slug, args.howrare_latency, args.rpc_latency).start()
+
+    temp_dir = None
+    database_url = args.database_url
+    if not database_url:
+        temp_dir = tempfile.TemporaryDirectory()
+        database_url = f"sqlite:///{os.path.join(temp_dir.name, 'bench.db')}"
+    configure_environment(stubs, database_url)
+    os.environ["OWNERSHIP_FLUSH_INTERVAL"] = "3600" # Flushed explicitly between cases
+
+    from shared.database import dispose_engine, init_db
+    from shared.http_client import close_http_session
+    from shared.repository import shutdown_db_executor
+
+    print(f"Stand-ins on {stubs.base_url}; database {database_url}")
+    print(f"Latency: HowRare {args.howrare_latency}s, RPC {args.rpc_latency}s\n")
+    try:
+        init_db()
+        await bench_sync(args.sizes, [True, False] if args.full_download else [True])
+        await bench_fetch_nfts(collection_slug, args.wallet_sizes, args.iterations)
+        await bench_trait_autocomplete(args.wallet_sizes, args.iterations)
+        bench_rarity_info()
+    finally:
+        await close_http_session()
+        await stubs.stop()
+        shutdown_db_executor()
+        dispose_engine()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+    print(f"\n{stubs.requests} stand-in requests served.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import random
+from aiohttp import web
+
+# Local stand-ins for the HowRare API and the Solana DAS RPC, serving deterministic synthetic data.
+# Used by the benchmark suite and the load generator so neither touches the live services.
+
+TRAIT_TYPES = {
+    "Background": ["Blue", "Green", "Red", "Purple", "Gold", "Black", "White", "Orange"],
+    "Body": ["Human", "Zombie", "Alien", "Ape", "Robot", "Skeleton"],
+    "Eyes": ["Normal", "Laser", "Sleepy", "Angry", "3D Glasses", "Closed", "Wink"],
+    "Hat": ["None", "Cap", "Crown", "Beanie", "Cowboy", "Halo", "Bandana", "Top Hat"],
+    "Mouth": ["Smile", "Frown", "Pipe", "Joint", "Grin", "Tongue"],
+    "Clothes": ["Hoodie", "Suit", "Tee", "Jacket", "Kimono", "Vest", "None"],
+}
+
+def collection_size(collection_slug: str) -> int:
+    """
+    Synthetic collections are named "<anything>_<size>", e.g. "bench_10000".
+    """
+    return int(collection_slug.rsplit("_", 1)[-1])
+
+def make_items(collection_slug: str, size: int, seed: int = 7):
+    """
+    HowRare-style items ({mint, name, rank, image, attributes[{name, value}]}) with shuffled ranks.
+    """
+    rng = random.Random(seed)
+    ranks = list(range(1, size + 1))
+    rng.shuffle(ranks)
+    items = []
+    for i in range(size):
+        attributes = [{"name": trait_type, "value": rng.choice(values)} for trait_type, values in TRAIT_TYPES.items()]
+        items.append({
+            "mint": f"{collection_slug}_mint_{i:07d}",
+            "name": f"Bench #{i}",
+            "rank": ranks[i],
+            "image": f"https://example.invalid/{collection_slug}/{i}.png",
+            "attributes": attributes,
+        })
+    return items
+
+def to_das_asset(item):
+    return {
+        "id": item["mint"],
+        "content": {
+            "metadata": {
+                "name": item["name"],
+                "attributes": [{"trait_type": attr["name"], "value": attr["value"]} for attr in item["attributes"]],
+            },
+            "links": {"image": item["image"]},
+        },
+    }
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+WALLET_PREFIX = "BenchWa11et" # Followed by <nfts held> and <first item> as 10/11 fixed-width base58 digits
+
+def _base58(number: int, width: int) -> str:
+    digits = []
+    for _ in range(width):
+        number, digit = divmod(number, 58)
+        digits.append(BASE58_ALPHABET[digit])
+    return "".join(reversed(digits))
+
+def _parse_base58(digits: str) -> int:
+    number = 0
+    for char in digits:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+    return number
+
+def wallet_address(wallet_size: int, first_item: int = 0) -> str:
+    """
+    A synthetic wallet holding wallet_size consecutive items of the RPC collection, starting at first_item
+    (wrapping around). Holdings are encoded in the address itself, which is a valid 32-character base58
+    string so /link_wallet accepts it.
+    """
+    return f"{WALLET_PREFIX}{_base58(wallet_size, 10)}{_base58(first_item, 11)}"
+
+def parse_wallet_address(address: str):
+    """
+    Returns (wallet_size, first_item) for a synthetic wallet address, or None for any other address.
+    """
+    if len(address) != 32 or not address.startswith(WALLET_PREFIX):
+        return None
+    try:
+        return _parse_base58(address[11:21]), _parse_base58(address[21:])
+    except ValueError:
+        return None
+
+def disjoint_wallets(wallet_sizes):
+    """
+    Wallet addresses for the given sizes that don't share any NFT (as long as the collection is big enough).
+    """
+    wallets, first_item = [], 0
+    for wallet_size in wallet_sizes:
+        wallets.append(wallet_address(wallet_size, first_item))
+        first_item += wallet_size
+    return wallets
+
+class StubServers:
+    """
+    Runs both stand-ins on one local aiohttp server.
+    HowRare: GET /collections/{slug} (size taken from the slug), streamed in chunks.
+    DAS: POST /rpc with getAssetsByOwner/searchAssets, single or batched, paginated like the real API.
+    Latency (seconds) is added before each response; it can be changed while the servers run.
+    """
+    def __init__(self, rpc_collection: str, howrare_latency: float = 0.0, rpc_latency: float = 0.0):
+        self.rpc_collection = rpc_collection
+        self.howrare_latency = howrare_latency
+        self.rpc_latency = rpc_latency
+        self._collections = {} # slug -> (items, encoded HowRare payload)
+        self._runner = None
+        self.base_url = None
+        self.requests = 0
+
+    def collection(self, collection_slug: str):
+        if collection_slug not in self._collections:
+            items = make_items(collection_slug, collection_size(collection_slug))
+            payload = json.dumps({"result": {"data": {"items": items}}}).encode()
+            self._collections[collection_slug] = (items, payload)
+        return self._collections[collection_slug]
+
+    @property
+    def howrare_url(self):
+        return self.base_url
+
+    @property
+    def rpc_url(self):
+        return f"{self.base_url}/rpc"
+
+    async def _howrare(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.howrare_latency)
+        _, payload = self.collection(request.match_info["slug"])
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        response.content_length = len(payload)
+        await response.prepare(request)
+        for start in range(0, len(payload), 64 * 1024):
+            await response.write(payload[start:start + 64 * 1024])
+        await response.write_eof()
+        return response
+
+    def _wallet_items(self, owner: str):
+        items, _ = self.collection(self.rpc_collection)
+        parsed = parse_wallet_address(owner)
+        if parsed is None:
+            return []
+        held, first_item = parsed
+        start = first_item % len(items)
+        return [items[(start + offset) % len(items)] for offset in range(min(held, len(items)))]
+
+    def _answer(self, call):
+        method, params = call.get("method"), call.get("params", {})
+        if method not in ("getAssetsByOwner", "searchAssets"):
+            return {"jsonrpc": "2.0", "id": call.get("id"), "error": {"code": -32601, "message": "Method not found"}}
+        held = self._wallet_items(params.get("ownerAddress", ""))
+        page, limit = params.get("page", 1), params.get("limit", 1000)
+        page_items = held[(page - 1) * limit:page * limit]
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": {
+            "total": len(page_items), "limit": limit, "page": page, "items": [to_das_asset(item) for item in page_items]
+        }}
+
+    async def _rpc(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.rpc_latency)
+        body = await request.json()
+        if isinstance(body, list):
+            return web.json_response([self._answer(call) for call in body])
+        return web.json_response(self._answer(body))
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_get("/collections/{slug}", self._howrare)
+        app.router.add_post("/rpc", self._rpc)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,105 +1,27 @@
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
-from shared.database import get_session, FlexPlayer, FlexGuildConfig, FlexNFT
+from discord.ext import commands
+from shared.database import get_pool_stats
+from shared import repository
+from shared.asset_cache import asset_cache, invalidate_wallet
+from shared.trait_index import trait_index_cache
+from shared.ownership_writer import ownership_writer
+from shared.guild_config import get_guild_collection, set_guild_collection
+from shared.collection_sync import CollectionSyncError, format_sync_delta, format_sync_stats
+from shared.rarity_config import get_tier_names
+from shared.image_cache import image_cache
+from shared.metrics import mark_command_failed
+from shared.discord_updates import discord_updates, interaction_route
+from shared.role_sync import compute_role_changes, format_role_sync_stats, get_role_sync_job
+from shared.sync_jobs import format_sync_job, get_sync_jobs
+from shared.sync_scheduler import PRIORITY_ADMIN, sync_scheduler
 import os
-import aiohttp
-import time
-import sys
-import asyncio
 
 ADMIN_ROLE = os.getenv("DISCORD_ADMIN_ROLE", "Admin")
-HOWRARE_API_BASE = os.getenv("HOWRARE_API_BASE", "https://api.howrare.is/v0.1")
 
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.is_syncing = False
-        self.stop_sync_flag = False
-        # Start the background sync task
-        # self.auto_sync_task.start() # Disabled to prevent startup crash/race conditions
-
-    def cog_unload(self):
-        self.auto_sync_task.cancel()
-
-    @tasks.loop(hours=24)
-    async def auto_sync_task(self):
-        """
-        Background task to sync collection metadata periodically.
-        This ensures new mints or metadata updates are captured even if no admin triggers it.
-        """
-        # Wait until bot is ready
-        await self.bot.wait_until_ready()
-        
-        if self.is_syncing:
-            print("Auto-sync skipped because a sync is already in progress.")
-            return
-
-        print("Starting scheduled auto-sync of collections...")
-        self.is_syncing = True
-        session = get_session()
-        try:
-            # Strict Mode: Only sync the collection defined in ENV
-            collection_slug = os.getenv("HOWRARE_COLLECTION", "the_growerz")
-            slugs = {collection_slug}
-
-            for collection_slug in slugs:
-                print(f"Auto-syncing collection: {collection_slug}")
-                
-                # Fetch full collection data
-                url = f"{HOWRARE_API_BASE}/collections/{collection_slug}"
-                async with aiohttp.ClientSession() as http_session:
-                    async with http_session.get(url) as response:
-                        if response.status != 200:
-                            print(f"Error fetching collection {collection_slug}: {response.status}")
-                            continue
-                        data = await response.json()
-
-                items = data.get('result', {}).get('data', {}).get('items', [])
-                if not items:
-                    print(f"No items found for {collection_slug}")
-                    continue
-
-                # Upsert items
-                count = 0
-                for item in items:
-                    if self.stop_sync_flag: # Allow admin to stop even auto-sync
-                        break
-
-                    mint = item.get('mint')
-                    if not mint: continue
-
-                    nft = session.query(FlexNFT).filter_by(mint=mint).first()
-                    if not nft:
-                        nft = FlexNFT(mint=mint)
-                        session.add(nft)
-                    
-                    nft.collection_slug = collection_slug
-                    nft.name = item.get('name')
-                    nft.rank = item.get('rank')
-                    nft.image_url = item.get('image')
-                    nft.attributes = item.get('attributes')
-                    nft.last_updated = time.time()
-                    count += 1
-                    
-                    if count % 100 == 0:
-                        session.commit()
-                        await asyncio.sleep(0) # Yield
-
-                session.commit()
-                print(f"Auto-sync finished for {collection_slug}: {count} items processed.")
-
-        except Exception as e:
-            print(f"Error in auto_sync_task: {e}")
-            session.rollback()
-        finally:
-            session.close()
-            self.is_syncing = False
-            self.stop_sync_flag = False
-
-    @auto_sync_task.before_loop
-    async def before_auto_sync(self):
-        await self.bot.wait_until_ready()
 
     def is_admin(self, interaction: discord.Interaction) -> bool:
         # Check if user has the configured Admin role OR is the server owner OR has Administrator permission
@@ -115,8 +37,10 @@ class Admin(commands.Cog):
             return
         
         await interaction.response.send_message("Restarting bot process... (This may take a few seconds)", ephemeral=True)
-        # Exit with status 1 so Docker/Systemd restarts it
-        sys.exit(1)
+        # Close cleanly (flushing queued ownership writes), then main.py exits with status 1 so Docker/Systemd restarts it.
+        # The next start skips the command sync when the tree hasn't changed.
+        self.bot.exit_code = 1
+        await self.bot.close()
 
     @app_commands.command(name="admin_stop", description="Gracefully shut down the bot")
     async def admin_stop(self, interaction: discord.Interaction):
@@ -127,106 +51,113 @@ class Admin(commands.Cog):
         await interaction.response.send_message("Shutting down bot... (Container may auto-restart depending on policy)", ephemeral=True)
         await self.bot.close()
 
-    @app_commands.command(name="admin_stop_sync", description="Stop any active collection sync")
-    async def admin_stop_sync(self, interaction: discord.Interaction):
+    @app_commands.command(name="admin_stop_sync", description="Stop active collection syncs (all, or one collection)")
+    @app_commands.describe(collection_slug="Only stop this collection's sync")
+    async def admin_stop_sync(self, interaction: discord.Interaction, collection_slug: str = None):
         if not self.is_admin(interaction):
             await interaction.response.send_message("You do not have permission.", ephemeral=True)
             return
-            
-        if not self.is_syncing:
-            await interaction.response.send_message("No sync is currently in progress.", ephemeral=True)
+
+        stopped, dropped = sync_scheduler.stop_sync(collection_slug.strip() if collection_slug else None)
+        if not stopped and not dropped:
+            await interaction.response.send_message("No sync is currently in progress in this bot process.", ephemeral=True)
             return
 
-        self.stop_sync_flag = True
-        await interaction.response.send_message("Signal sent to stop sync. It should halt shortly.", ephemeral=True)
+        await interaction.response.send_message(
+            f"Signal sent to stop {stopped} running sync(s); {dropped} queued sync(s) dropped. "
+            "Running syncs halt after their current batch. Run `/admin_sync_collection` again to resume.",
+            ephemeral=True
+        )
 
     @app_commands.command(name="admin_sync_collection", description="Sync full collection metadata to database (Heavy Operation)")
-    async def admin_sync_collection(self, interaction: discord.Interaction):
+    @app_commands.describe(restart="Start from the first item instead of resuming an unfinished sync")
+    async def admin_sync_collection(self, interaction: discord.Interaction, restart: bool = False):
         if not self.is_admin(interaction):
             await interaction.response.send_message("You do not have permission.", ephemeral=True)
             return
 
-        if self.is_syncing:
-            await interaction.response.send_message("A sync is already in progress. Use `/admin_stop_sync` to stop it.", ephemeral=True)
+        # Get collection slug (cached guild config)
+        collection_slug = get_guild_collection(interaction.guild_id)
+        if sync_scheduler.is_active(collection_slug):
+            await interaction.response.send_message(f"A sync of `{collection_slug}` is already queued or running. Use `/admin_stop_sync` to stop it.", ephemeral=True)
             return
 
-        self.is_syncing = True
-        self.stop_sync_flag = False
-        
         await interaction.response.defer()
-        session = get_session()
+        # Status edits and followups go through the outbound queue: edits are merged and paced,
+        # so the sync loop never waits on Discord
+        route = interaction_route(interaction)
         try:
-            # Get collection slug (Strict Mode: Use Env Var)
-            collection_slug = os.getenv("HOWRARE_COLLECTION", "the_growerz")
-
-            # Fetch full collection data
-            url = f"{HOWRARE_API_BASE}/collections/{collection_slug}"
-            async with aiohttp.ClientSession() as http_session:
-                async with http_session.get(url) as response:
-                    if response.status != 200:
-                        await interaction.followup.send(f"Error fetching collection: {response.status}")
-                        self.is_syncing = False
-                        return
-                    data = await response.json()
-
-            items = data.get('result', {}).get('data', {}).get('items', [])
-            if not items:
-                await interaction.followup.send("No items found in API response.")
-                self.is_syncing = False
-                return
-
-            # Upsert items into FlexNFT
-            count = 0
-            total = len(items)
-            
             # Initial status update
-            status_msg = await interaction.followup.send(f"Starting sync for {total} items...")
-
-            for i, item in enumerate(items):
-                # Check for stop signal
-                if self.stop_sync_flag:
-                    await interaction.followup.send(f"Sync stopped by admin at item {count}/{total}.")
-                    break
-
-                mint = item.get('mint')
-                if not mint: continue
-
-                nft = session.query(FlexNFT).filter_by(mint=mint).first()
-                if not nft:
-                    nft = FlexNFT(mint=mint)
-                    session.add(nft)
-                
-                nft.collection_slug = collection_slug
-                nft.name = item.get('name')
-                nft.rank = item.get('rank')
-                nft.image_url = item.get('image')
-                nft.attributes = item.get('attributes')
-                nft.last_updated = time.time()
-                count += 1
-                
-                # Commit in batches to avoid massive transaction and allow other DB ops
-                if count % 50 == 0:
-                    session.commit()
-                    # Yield control to event loop to prevent bot freezing
-                    await asyncio.sleep(0)
-                
-                # Update status every 500 items
-                if count % 500 == 0:
-                    try:
-                        await status_msg.edit(content=f"Syncing... {count}/{total} items processed.")
-                    except:
-                        pass
-
-            session.commit()
-            if not self.stop_sync_flag:
-                await interaction.followup.send(f"Successfully synced {count} NFTs for collection `{collection_slug}`.")
-
+            status_msg = await discord_updates.send(route, interaction.followup.send, f"Starting sync for `{collection_slug}`...")
+
+            async def report_progress(stats, total):
+                progress = f"{stats['processed']}/{total}" if total else str(stats['processed'])
+                discord_updates.edit(status_msg, route=route, content=f"Syncing... {progress} items processed.")
+
+            # Queued ahead of scheduled syncs and run under the collection's lease, so no other
+            # process syncs it at the same time. Items are streamed from HowRare and written batch by batch;
+            # unfinished jobs for the collection resume after their last committed batch unless restart is set
+            request = sync_scheduler.submit(collection_slug, PRIORITY_ADMIN, trigger="admin", resume=not restart, on_progress=report_progress)
+            if sync_scheduler.running() >= sync_scheduler.concurrency and request.started_at is None:
+                discord_updates.edit(status_msg, route=route, content=f"Sync for `{collection_slug}` queued; {sync_scheduler.running()} other sync(s) running.")
+            stats = await request.future
+            resumed = f" (resumed job #{stats['job_id']} from item {stats['resumed_from']})" if stats["resumed_from"] else ""
+
+            if stats["stopped"]:
+                await discord_updates.send(route, interaction.followup.send, f"Sync stopped at item {stats['processed']}{resumed}. Run `/admin_sync_collection` again to resume.")
+            else:
+                # The scheduler also warms the artwork cache for the collection
+                await discord_updates.send(
+                    route, interaction.followup.send,
+                    f"Successfully synced collection `{collection_slug}`{resumed}: {format_sync_stats(stats)}.\n"
+                    f"```\n{format_sync_delta(stats)}\n```"
+                )
+
+        except CollectionSyncError as e:
+            await discord_updates.send(route, interaction.followup.send, str(e))
         except Exception as e:
-            session.rollback()
-            await interaction.followup.send(f"Error syncing collection: {e}")
-        finally:
-            session.close()
-            self.is_syncing = False
+            mark_command_failed(interaction)
+            await discord_updates.send(route, interaction.followup.send, f"Error syncing collection: {e}")
+
+    @app_commands.command(name="admin_sync_history", description="Show recent collection sync jobs and their throughput")
+    async def admin_sync_history(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("You do not have permission.", ephemeral=True)
+            return
+
+        jobs = await get_sync_jobs()
+        if not jobs:
+            await interaction.response.send_message("No sync jobs recorded yet.", ephemeral=True)
+            return
+
+        message = "\n".join(format_sync_job(job) for job in jobs)
+        await interaction.response.send_message(message[:2000], ephemeral=True)
+
+    @app_commands.command(name="admin_db_stats", description="Show database connection pool statistics")
+    async def admin_db_stats(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("You do not have permission.", ephemeral=True)
+            return
+
+        stats = get_pool_stats()
+        if not stats.get("initialized"):
+            await interaction.response.send_message("Database engine has not been initialized yet.", ephemeral=True)
+            return
+
+        lines = [f"**{key}**: {value:.2f}" if isinstance(value, float) else f"**{key}**: {value}" for key, value in stats.items() if key != "initialized"]
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+    @app_commands.command(name="admin_cache_stats", description="Show cache, ownership write buffer, Discord update queue and collection sync statistics")
+    async def admin_cache_stats(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("You do not have permission.", ephemeral=True)
+            return
+
+        sections = []
+        for title, stats in (("Asset cache", asset_cache.stats()), ("Trait index", trait_index_cache.stats()), ("Ownership writes", ownership_writer.stats()), ("Discord updates", discord_updates.stats()), ("Image cache", image_cache.stats()), ("Collection syncs", sync_scheduler.stats())):
+            lines = [f"**{key}**: {value:.2%}" if key == "hit_rate" else f"**{key}**: {value}" for key, value in stats.items()]
+            sections.append(f"**{title}**\n" + "\n".join(lines))
+        await interaction.response.send_message("\n\n".join(sections), ephemeral=True)
 
     @app_commands.command(name="admin_set_collection", description="Change the target NFT collection")
     async def admin_set_collection(self, interaction: discord.Interaction, collection_slug: str):
@@ -234,25 +165,16 @@ class Admin(commands.Cog):
             await interaction.response.send_message("You do not have permission.", ephemeral=True)
             return
 
-        await interaction.response.send_message("This command is disabled in Strict Mode. The collection is set via environment variables.", ephemeral=True)
-        return
-        
-        # session = get_session()
-        # try:
-        #     config = session.query(FlexGuildConfig).filter_by(guild_id=interaction.guild_id).first()
-        #     if not config:
-        #         config = FlexGuildConfig(guild_id=interaction.guild_id, collection_slug=collection_slug)
-        #         session.add(config)
-        #     else:
-        #         config.collection_slug = collection_slug
-            
-        #     session.commit()
-        #     await interaction.response.send_message(f"Collection set to `{collection_slug}`.", ephemeral=True)
-        # except Exception as e:
-        #     session.rollback()
-        #     await interaction.response.send_message(f"Error: {e}", ephemeral=True)
-        # finally:
-        #     session.close()
+        collection_slug = collection_slug.strip()
+        try:
+            await set_guild_collection(interaction.guild_id, collection_slug)
+            message = f"Collection set to `{collection_slug}`."
+            if await repository.count_collection_nfts(collection_slug) == 0:
+                message += " No metadata is stored for it yet; run `/admin_sync_collection` next."
+            await interaction.response.send_message(message, ephemeral=True)
+        except Exception as e:
+            mark_command_failed(interaction)
+            await interaction.response.send_message(f"Error: {e}", ephemeral=True)
 
     @app_commands.command(name="admin_set_wallet", description="Manually link a wallet for a user")
     async def admin_set_wallet(self, interaction: discord.Interaction, user: discord.User, address: str):
@@ -260,21 +182,142 @@ class Admin(commands.Cog):
             await interaction.response.send_message("You do not have permission.", ephemeral=True)
             return
 
-        session = get_session()
         try:
-            player = session.query(FlexPlayer).filter_by(discord_id=user.id).first()
-            if not player:
-                player = FlexPlayer(discord_id=user.id)
-                session.add(player)
-            
-            player.wallet_address = address
-            session.commit()
+            previous_wallet = await repository.set_wallet(user.id, address)
+            invalidate_wallet(previous_wallet)
+            invalidate_wallet(address)
             await interaction.response.send_message(f"Wallet for {user.mention} set to `{address}`.", ephemeral=True)
         except Exception as e:
-            session.rollback()
+            mark_command_failed(interaction)
             await interaction.response.send_message(f"Error: {e}", ephemeral=True)
-        finally:
-            session.close()
+
+    async def rule_tier_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        collection_slug = get_guild_collection(interaction.guild_id)
+        return [
+            app_commands.Choice(name=tier, value=tier)
+            for tier in get_tier_names(collection_slug) if current.lower() in tier.lower()
+        ][:25]
+
+    @app_commands.command(name="admin_role_rule_add", description="Grant a role to holders (optionally of a rarity tier)")
+    @app_commands.describe(min_count="NFTs needed to qualify", tier="Only count NFTs of this tier")
+    @app_commands.autocomplete(tier=rule_tier_autocomplete)
+    async def admin_role_rule_add(self, interaction: discord.Interaction, role: discord.Role, min_count: app_commands.Range[int, 1] = 1, tier: str = None):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("You do not have permission.", ephemeral=True)
+            return
+
+        collection_slug = get_guild_collection(interaction.guild_id)
+        if tier and tier not in get_tier_names(collection_slug):
+            await interaction.response.send_message(f"Unknown tier `{tier}` for collection `{collection_slug}`.", ephemeral=True)
+            return
+
+        try:
+            await repository.set_role_rule(interaction.guild_id, role.id, min_count, tier)
+            requirement = f"{min_count}+ {tier} NFT(s)" if tier else f"{min_count}+ NFT(s)"
+            await interaction.response.send_message(
+                f"{role.mention} will be given to holders of {requirement} from `{collection_slug}`. Run `/admin_role_sync` to apply it.",
+                ephemeral=True
+            )
+        except Exception as e:
+            mark_command_failed(interaction)
+            await interaction.response.send_message(f"Error: {e}", ephemeral=True)
+
+    @app_commands.command(name="admin_role_rule_remove", description="Stop managing a holder role")
+    async def admin_role_rule_remove(self, interaction: discord.Interaction, role: discord.Role):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("You do not have permission.", ephemeral=True)
+            return
+
+        try:
+            if await repository.remove_role_rule(interaction.guild_id, role.id):
+                await interaction.response.send_message(f"{role.mention} is no longer managed. Members keep it until removed manually.", ephemeral=True)
+            else:
+                await interaction.response.send_message(f"{role.mention} has no holder rule.", ephemeral=True)
+        except Exception as e:
+            mark_command_failed(interaction)
+            await interaction.response.send_message(f"Error: {e}", ephemeral=True)
+
+    @app_commands.command(name="admin_role_rules", description="List holder role rules")
+    async def admin_role_rules(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("You do not have permission.", ephemeral=True)
+            return
+
+        rules = await repository.get_role_rules(interaction.guild_id)
+        if not rules:
+            await interaction.response.send_message("No holder role rules. Add one with `/admin_role_rule_add`.", ephemeral=True)
+            return
+
+        lines = [
+            f"<@&{rule['role_id']}>: {rule['min_count']}+ {rule['tier'] + ' ' if rule['tier'] else ''}NFT(s)"
+            for rule in rules
+        ]
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+    @app_commands.command(name="admin_role_sync", description="Grant/revoke holder roles for all members (resumes a stopped run)")
+    async def admin_role_sync(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("You do not have permission.", ephemeral=True)
+            return
+
+        job = get_role_sync_job(interaction.guild_id)
+        if job.running:
+            await interaction.response.send_message(f"Role sync in progress: {format_role_sync_stats(job.stats())}.", ephemeral=True)
+            return
+
+        await interaction.response.defer()
+        route = interaction_route(interaction)
+        try:
+            guild = interaction.guild
+            if job.pending:
+                status_msg = await discord_updates.send(route, interaction.followup.send, f"Resuming role sync: {len(job.pending)} member(s) left.")
+            else:
+                rules = await repository.get_role_rules(guild.id)
+                if not rules:
+                    await discord_updates.send(route, interaction.followup.send, "No holder role rules. Add one with `/admin_role_rule_add`.")
+                    return
+
+                # Bulk diff: one holdings query plus the member cache
+                if not guild.chunked:
+                    await guild.chunk()
+                holdings = await repository.get_holdings_by_discord_id(get_guild_collection(guild.id))
+                job.plan(compute_role_changes(guild.members, rules, holdings))
+                if not job.pending:
+                    await discord_updates.send(route, interaction.followup.send, f"All {guild.member_count} members already have the right holder roles.")
+                    return
+                status_msg = await discord_updates.send(route, interaction.followup.send, f"Role sync planned: {job.planned} of {guild.member_count} member(s) need changes.")
+
+            async def report_progress(job):
+                discord_updates.edit(status_msg, route=route, content=f"Role sync: {format_role_sync_stats(job.stats())}.")
+
+            async def report_done(job):
+                stopped = " (stopped; run `/admin_role_sync` to resume)" if job.pending else ""
+                error = f"\nLast error: {job.last_error}" if job.last_error else ""
+                await report_progress(job)
+                try:
+                    await discord_updates.send(route, interaction.followup.send, f"Role sync finished{stopped}: {format_role_sync_stats(job.stats())}.{error}")
+                except discord.HTTPException as e:
+                    print(f"Role sync report failed: {e}")
+
+            job.start(guild, on_progress=report_progress, on_done=report_done)
+
+        except Exception as e:
+            mark_command_failed(interaction)
+            await discord_updates.send(route, interaction.followup.send, f"Error syncing roles: {e}")
+
+    @app_commands.command(name="admin_role_sync_stop", description="Pause the running holder role sync")
+    async def admin_role_sync_stop(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("You do not have permission.", ephemeral=True)
+            return
+
+        job = get_role_sync_job(interaction.guild_id)
+        if not job.running:
+            await interaction.response.send_message("No role sync is currently running.", ephemeral=True)
+            return
+
+        job.stop()
+        await interaction.response.send_message("Role sync will pause after the current member. Run `/admin_role_sync` to resume.", ephemeral=True)
 
 async def setup(bot):
     await bot.add_cog(Admin(bot))
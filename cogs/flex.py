@@ -3,35 +3,40 @@ from discord import app_commands
 from discord.ext import commands
 import os
 import random
-from shared.database import get_session, FlexPlayer, FlexGuildConfig, FlexNFT
-from shared.solana_utils import get_assets_by_owner
-from shared.rarity_config import RARITY_CONFIGS
+from shared import repository
+from shared.database import attributes_to_traits
+from shared.guild_config import get_guild_collection
+from shared.solana_utils import get_collection_address
+from shared.asset_cache import get_cached_assets_by_owner
+from shared.ownership import OWNERSHIP_MAX_STALENESS, refresh_queue
+from shared.ownership_writer import ownership_writer
+from shared.image_cache import image_cache
+from shared.metrics import AUTOCOMPLETE_SECONDS, mark_command_failed
+from shared.trait_index import TraitIndex, trait_index_cache
+from shared.rarity_config import get_rarity_info, get_tier_names
 
-HOWRARE_API_BASE = os.getenv("HOWRARE_API_BASE", "https://api.howrare.is/v0.1")
-DEFAULT_COLLECTION = os.getenv("HOWRARE_COLLECTION", "the_growerz")
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "10"))
 
-def get_rarity_info(rank: int, attributes: list, collection_slug: str):
+def filter_nfts(nfts, trait_type: str = None, trait_value: str = None, loose: bool = False, tier: str = None):
     """
-    Determines the rarity name and color for a given rank and attributes based on the collection configuration.
+    Filters a wallet's NFTs (as returned by fetch_nfts) by trait and/or tier.
+    Trait: exact (trait_type, trait_value), or with loose=True any trait whose type or value contains
+    trait_value (case-insensitive). Tier: exact tier name.
     """
-    config = RARITY_CONFIGS.get(collection_slug)
-    
-    # Default fallback if config doesn't exist
-    if not config:
-        return "Ranked", 0x808080 # Grey
-
-    # 1. Check Special Attributes
-    for special in config.get("special_attributes", []):
-        for attr in attributes:
-            if attr.get('name') == special['trait_type'] and str(attr.get('value')).lower() == special['value'].lower():
-                return special['name'], special['color']
-
-    # 2. Check Rank Tiers
-    for tier in config.get("tiers", []):
-        if rank <= tier['max_rank']:
-            return tier['name'], tier['color']
-            
-    return "Common", 0xADFF2F
+    needle = trait_value.lower() if trait_value and loose else None
+    matches = []
+    for nft in nfts:
+        if tier and nft.get('tier') != tier:
+            continue
+        if trait_value:
+            traits = [(trait['trait_type'], trait['value']) for trait in attributes_to_traits(nft['mint'], nft.get('attributes'))]
+            if loose:
+                if not any(needle in name.lower() or needle in value.lower() for name, value in traits):
+                    continue
+            elif (trait_type, trait_value) not in traits:
+                continue
+        matches.append(nft)
+    return matches
 
 class Flex(commands.Cog):
     """
@@ -42,182 +47,137 @@ class Flex(commands.Cog):
 
     async def fetch_nfts(self, wallet_address: str, collection_slug: str):
         """
-        Fetches NFTs for a wallet from the Solana RPC (DAS API) and merges with local DB data.
+        Returns the wallet's NFTs from the local DB when the background refresher has kept them fresh;
+        otherwise fetches them from the Solana RPC (DAS API) and merges with local DB data.
         """
-        session = get_session()
         try:
-            # 1. Fetch Assets via Solana RPC (DAS API)
+            # 0. Local answer if ownership was refreshed within OWNERSHIP_MAX_STALENESS
+            # Marking the wallet active puts it at the front of the refresher's queue
+            refresh_queue.mark_active(wallet_address, collection_slug)
+            nfts = await repository.get_fresh_wallet_nfts(wallet_address, collection_slug, OWNERSHIP_MAX_STALENESS)
+            if nfts is not None:
+                return nfts
+
+            # 1. Fetch Assets via Solana RPC (DAS API), scoped to the collection when its address is configured
+            # Repeat lookups within ASSET_CACHE_TTL are served from the in-process cache
             # This returns a list of dicts: {mint, name, image, attributes}
-            assets = await get_assets_by_owner(wallet_address)
-            
-            if not assets:
-                # Clear ownership for this wallet if RPC says empty
-                session.query(FlexNFT).filter_by(owner_wallet=wallet_address).update({"owner_wallet": None})
-                session.commit()
-                return []
+            try:
+                assets = await get_cached_assets_by_owner(wallet_address, get_collection_address(collection_slug))
+            except Exception as e:
+                # Don't reconcile against a failed lookup (it would clear every NFT the wallet holds);
+                # answer from the stored ownership and leave the refresh to a later call
+                print(f"RPC lookup failed for {wallet_address}, using stored ownership: {e}")
+                return await ownership_writer.current_nfts(wallet_address, collection_slug)
 
             # Create a map of live assets for easy lookup
             asset_map = {asset['mint']: asset for asset in assets}
-            owned_mints = list(asset_map.keys())
-            
-            # 2. DB Operations
-            
-            # A. Clear ownership for NFTs that were owned by this wallet but are no longer in the live list
-            # This fixes "Incorrect Wallet Amounts" in autocomplete/DB queries
-            session.query(FlexNFT).filter(
-                FlexNFT.owner_wallet == wallet_address,
-                FlexNFT.mint.notin_(owned_mints)
-            ).update({"owner_wallet": None}, synchronize_session=False)
-
-            # B. Get existing NFTs from DB
-            mints_in_db = session.query(FlexNFT).filter(
-                FlexNFT.mint.in_(owned_mints),
-                FlexNFT.collection_slug == collection_slug
-            ).all()
-            
-            results = []
-            for nft in mints_in_db:
-                live_asset = asset_map.get(nft.mint)
-                if not live_asset: continue
-                
-                # Update Owner
-                if nft.owner_wallet != wallet_address:
-                    nft.owner_wallet = wallet_address
-                
-                # Update Attributes (Fixes "Stale Traits")
-                # We trust the live RPC data over the cached DB data for attributes
-                if live_asset.get('attributes'):
-                    nft.attributes = live_asset['attributes']
-                    
-                # Update Image
-                if live_asset.get('image'):
-                    nft.image_url = live_asset['image']
-                
-                results.append({
-                    'name': nft.name,
-                    'rank': nft.rank,
-                    'image': nft.image_url,
-                    'attributes': nft.attributes,
-                    'mint': nft.mint
-                })
-            
-            session.commit()
-            return results
+
+            # 2. Diff against the DB (one read); real changes are queued and written behind in batches
+            return await ownership_writer.reconcile(wallet_address, collection_slug, asset_map)
 
         except Exception as e:
             print(f"Error in fetch_nfts: {e}")
             return []
-        finally:
-            session.close()
-            return []
-        finally:
-            session.close()
 
     async def trait_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
         """
         Autocomplete function for the 'trait_filter' argument in the /flex command.
         """
-        session = get_session()
-        try:
-            # 1. Get User Wallet
-            player = session.query(FlexPlayer).filter_by(discord_id=interaction.user.id).first()
-            if not player or not player.wallet_address:
+        with AUTOCOMPLETE_SECONDS.time(option="trait_filter"):
+            try:
+                # 1. Get User Wallet (short-lived in-process cache)
+                wallet_address = await repository.get_wallet_cached(interaction.user.id)
+                if not wallet_address:
+                    return []
+
+                # 2. Get Collection Slug (cached guild config)
+                collection_slug = get_guild_collection(interaction.guild_id)
+
+                # 3. Get the wallet's trait index, built from the indexed trait table once per cache period
+                index = trait_index_cache.get(wallet_address, collection_slug)
+                if index is None:
+                    index = TraitIndex(await repository.get_wallet_trait_counts(wallet_address, collection_slug))
+                    trait_index_cache.put(wallet_address, collection_slug, index)
+
+                # 4. Prefix/substring lookup, ranked by how many of the user's NFTs carry the trait
+                return [
+                    app_commands.Choice(name=f"{label} ({count})", value=label)
+                    for label, count in index.search(current, limit=25) # Discord limit is 25 choices
+                ]
+
+            except Exception:
                 return []
 
-            # 2. Get Collection Slug (Strict Mode: Use Env Var)
-            collection_slug = DEFAULT_COLLECTION
-
-            # 3. Get User's NFTs (Local DB only for speed)
-            user_nfts = session.query(FlexNFT).filter_by(owner_wallet=player.wallet_address, collection_slug=collection_slug).all()
-
-            # 4. Extract Unique Traits
-            traits = set()
-            for nft in user_nfts:
-                if not nft.attributes: continue
-                for attr in nft.attributes:
-                    name = attr.get('name')
-                    value = attr.get('value')
-                    if name and value:
-                        traits.add(f"{name}: {value}")
-            
-            # 5. Filter and Return
-            choices = [
-                app_commands.Choice(name=trait, value=trait)
-                for trait in sorted(list(traits))
-                if current.lower() in trait.lower()
-            ]
-            return choices[:25] # Discord limit is 25 choices
-
-        except Exception:
-            return []
-        finally:
-            session.close()
+    async def tier_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        """
+        Autocomplete function for the 'tier' argument in the /flex command: the user's tiers with counts.
+        """
+        with AUTOCOMPLETE_SECONDS.time(option="tier"):
+            try:
+                wallet_address = await repository.get_wallet_cached(interaction.user.id)
+                if not wallet_address:
+                    return []
+
+                collection_slug = get_guild_collection(interaction.guild_id)
+                tier_counts = await repository.get_wallet_tier_counts(wallet_address, collection_slug)
+
+                return [
+                    app_commands.Choice(name=f"{tier} ({tier_counts[tier]})", value=tier)
+                    for tier in get_tier_names(collection_slug)
+                    if tier in tier_counts and current.lower() in tier.lower()
+                ][:25]
+
+            except Exception:
+                return []
 
     @app_commands.command(name="flex", description="Flex your NFTs")
-    @app_commands.autocomplete(trait_filter=trait_autocomplete)
-    async def flex(self, interaction: discord.Interaction, trait_filter: str = None):
+    @app_commands.autocomplete(trait_filter=trait_autocomplete, tier=tier_autocomplete)
+    async def flex(self, interaction: discord.Interaction, trait_filter: str = None, tier: str = None):
         """
-        The main command to display a random NFT owned by the user, optionally filtered by trait.
+        The main command to display a random NFT owned by the user, optionally filtered by trait and/or rarity tier.
         """
         await interaction.response.defer()
         
-        session = get_session()
         try:
-            player = session.query(FlexPlayer).filter_by(discord_id=interaction.user.id).first()
-            if not player or not player.wallet_address:
+            wallet_address = await repository.get_wallet(interaction.user.id)
+            if not wallet_address:
                 await interaction.followup.send("You need to link your wallet first using `/link_wallet`.")
                 return
 
-            # Get Collection Slug (Strict Mode: Use Env Var)
-            collection_slug = DEFAULT_COLLECTION
+            # Get Collection Slug (cached guild config, no DB access)
+            collection_slug = get_guild_collection(interaction.guild_id)
             
             # Fetch NFTs
-            user_nfts = await self.fetch_nfts(player.wallet_address, collection_slug)
+            user_nfts = await self.fetch_nfts(wallet_address, collection_slug)
             
             if not user_nfts:
                 # Fallback message since we can't actually hit the API without a real key/endpoint
                 # Check if DB has any items for this collection at all
-                item_count = session.query(FlexNFT).filter_by(collection_slug=collection_slug).count()
+                item_count = await repository.count_collection_nfts(collection_slug)
                 if item_count == 0:
                      await interaction.followup.send(f"Database is empty for collection `{collection_slug}`. Please ask an admin to run `/admin_sync_collection` first.")
                 else:
-                    await interaction.followup.send(f"Could not find any NFTs from collection `{collection_slug}` in wallet `{player.wallet_address}`.")
+                    await interaction.followup.send(f"Could not find any NFTs from collection `{collection_slug}` in wallet `{wallet_address}`.")
                 return
 
-            # Filter by trait if requested
-            if trait_filter:
-                # Check if filter is in "Trait: Value" format from autocomplete
+            # Filter by trait and/or tier if requested. This filters the reconciled results in memory,
+            # since their ownership changes may still be queued in the write-behind buffer
+            if trait_filter or tier:
                 filter_name = None
                 filter_value = trait_filter
-                if ": " in trait_filter:
+                # Check if filter is in "Trait: Value" format from autocomplete
+                if trait_filter and ": " in trait_filter:
                     parts = trait_filter.split(": ", 1)
                     if len(parts) == 2:
                         filter_name = parts[0]
                         filter_value = parts[1]
 
-                filtered_nfts = []
-                for nft in user_nfts:
-                    attributes = nft.get('attributes', [])
-                    match = False
-                    for attr in attributes:
-                        attr_name = attr.get('name', '')
-                        attr_value = str(attr.get('value', ''))
-                        
-                        # If we have a specific name from autocomplete, match both
-                        if filter_name:
-                            if attr_name == filter_name and attr_value == filter_value:
-                                match = True
-                                break
-                        # Fallback to loose matching if user typed manually
-                        else:
-                            if trait_filter.lower() in attr_value.lower() or trait_filter.lower() in attr_name.lower():
-                                match = True
-                                break
-                    if match:
-                        filtered_nfts.append(nft)
+                # Exact match from autocomplete, or loose matching if user typed manually
+                filtered_nfts = filter_nfts(user_nfts, filter_name, filter_value, loose=filter_name is None, tier=tier)
                 
                 if not filtered_nfts:
-                    await interaction.followup.send(f"Found {len(user_nfts)} NFTs, but none matched filter `{trait_filter}`.")
+                    filters = " and ".join(f"`{f}`" for f in (trait_filter, tier) if f)
+                    await interaction.followup.send(f"Found {len(user_nfts)} NFTs, but none matched filter {filters}.")
                     return
                 user_nfts = filtered_nfts
 
@@ -230,7 +190,7 @@ class Flex(commands.Cog):
             top_nft = random.choice(user_nfts)
             
             # Determine Color based on Rank
-            rank = int(top_nft.get('rank', 999999))
+            rank = int(top_nft.get('rank') or 999999)
             
             rarity_status, color = get_rarity_info(rank, top_nft.get('attributes', []), collection_slug)
 
@@ -248,14 +208,65 @@ class Flex(commands.Cog):
             # Field 3: Owned Count
             embed.add_field(name="Owned", value=str(len(user_nfts)), inline=True)
             
-            embed.set_image(url=top_nft['image'])
-            
-            await interaction.followup.send(embed=embed)
+            # Artwork: the locally cached copy when there is one, so gateway latency never shows in the embed
+            send_kwargs = {}
+            image_name = await image_cache.lookup(top_nft['image'])
+            if image_name and image_cache.public_url(image_name):
+                embed.set_image(url=image_cache.public_url(image_name))
+            elif image_name:
+                send_kwargs['file'] = discord.File(image_cache.path(image_name), filename=image_name)
+                embed.set_image(url=f"attachment://{image_name}")
+            else:
+                embed.set_image(url=top_nft['image'])
+                image_cache.fetch_in_background(top_nft['image'])
+
+            await interaction.followup.send(embed=embed, **send_kwargs)
+
+        except Exception as e:
+            mark_command_failed(interaction)
+            await interaction.followup.send(f"An error occurred: {e}")
+
+    @app_commands.command(name="flex_leaderboard", description="Top holders of this server's collection")
+    @app_commands.describe(sort_by="Rank holders by NFTs held or by their best-ranked NFT", page="Page number")
+    @app_commands.choices(sort_by=[
+        app_commands.Choice(name="Most held", value="count"),
+        app_commands.Choice(name="Best rank", value="best_rank"),
+    ])
+    async def flex_leaderboard(self, interaction: discord.Interaction, sort_by: str = "count", page: app_commands.Range[int, 1] = 1):
+        """
+        Paginated read of the precomputed holder stats for the guild's collection.
+        """
+        await interaction.response.defer()
+
+        try:
+            collection_slug = get_guild_collection(interaction.guild_id)
+            offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+            total, rows = await repository.get_leaderboard(collection_slug, sort_by, offset, LEADERBOARD_PAGE_SIZE)
+
+            if not rows:
+                if total == 0:
+                    await interaction.followup.send(f"No holders recorded yet for collection `{collection_slug}`.")
+                else:
+                    await interaction.followup.send(f"Page {page} is empty.")
+                return
+
+            tier_order = get_tier_names(collection_slug)
+            lines = []
+            for position, row in enumerate(rows, start=offset + 1):
+                holder = f"<@{row['discord_id']}>" if row['discord_id'] else f"`{row['wallet'][:4]}...{row['wallet'][-4:]}`"
+                best_rank = f"#{row['best_rank']}" if row['best_rank'] is not None else "-"
+                tiers = ", ".join(f"{tier} {row['tier_counts'][tier]}" for tier in tier_order if tier in row['tier_counts'])
+                line = f"**{position}.** {holder} - {row['nft_count']} held, best {best_rank}"
+                lines.append(f"{line} ({tiers})" if tiers else line)
+
+            pages = max((total + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE, 1)
+            embed = discord.Embed(title=f"{collection_slug} Leaderboard", description="\n".join(lines), color=0xFFD700)
+            embed.set_footer(text=f"Page {page}/{pages} - {total} holders")
+            await interaction.followup.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
 
         except Exception as e:
+            mark_command_failed(interaction)
             await interaction.followup.send(f"An error occurred: {e}")
-        finally:
-            session.close()
 
 async def setup(bot):
     await bot.add_cog(Flex(bot))
@@ -15,7 +15,7 @@ class Help(commands.Cog):
         
         embed.add_field(
             name="/admin_sync_collection", 
-            value="**Description:** Downloads the full collection metadata from HowRare.is to the bot's database.\n**When to use:** Run this once when setting up the bot, or if you change the collection.\n**Note:** This is a heavy operation.", 
+            value="**Description:** Downloads the full collection metadata from HowRare.is to the bot's database.\n**When to use:** Run this once when setting up the bot, or if you change the collection.\n**Note:** This is a heavy operation. A stopped or interrupted sync resumes where it left off; pass `restart: True` to start over. Collections are also resynced automatically every day. `/admin_sync_history` shows recent runs.", 
             inline=False
         )
         
@@ -31,6 +31,12 @@ class Help(commands.Cog):
             inline=False
         )
 
+        embed.add_field(
+            name="/admin_role_rule_add [role] [min_count] [tier]",
+            value="**Description:** Grants a role to members holding at least `min_count` NFTs of this server's collection (optionally only counting one rarity tier).\n**Apply:** Run `/admin_role_sync` to grant/revoke roles for all members; `/admin_role_sync_stop` pauses it and running it again resumes.",
+            inline=False
+        )
+
         embed.add_field(
             name="/admin_set_role [role_name]", 
             value=f"**Description:** Configures the role name required to use admin commands.\n**Current Config:** `{ADMIN_ROLE}` (via .env)", 
@@ -0,0 +1,32 @@
+from discord.ext import commands, tasks
+from shared.ownership import OWNERSHIP_REFRESH_INTERVAL, run_refresh_cycle
+
+class OwnershipRefresher(commands.Cog):
+    """
+    Background worker that keeps FlexNFT.owner_wallet fresh for linked wallets, so /flex can
+    answer from the local database instead of calling the RPC inside the interaction.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        if OWNERSHIP_REFRESH_INTERVAL > 0:
+            self.refresh_task.change_interval(seconds=OWNERSHIP_REFRESH_INTERVAL)
+            self.refresh_task.start()
+
+    def cog_unload(self):
+        self.refresh_task.cancel()
+
+    @tasks.loop(seconds=30)
+    async def refresh_task(self):
+        try:
+            stats = await run_refresh_cycle()
+            if stats["refreshed"] or stats["failed"]:
+                print(f"Ownership refresh: {stats['refreshed']} wallet(s) refreshed, {stats['failed']} failed.")
+        except Exception as e:
+            print(f"Error in ownership refresh: {e}")
+
+    @refresh_task.before_loop
+    async def before_refresh(self):
+        await self.bot.wait_until_ready()
+
+async def setup(bot):
+    await bot.add_cog(OwnershipRefresher(bot))
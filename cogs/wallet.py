@@ -1,7 +1,9 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-from shared.database import get_session, FlexPlayer
+from shared import repository
+from shared.asset_cache import invalidate_wallet
+from shared.metrics import mark_command_failed
 import re
 
 BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
@@ -23,50 +25,35 @@ class Wallet(commands.Cog):
             await interaction.response.send_message("Invalid Solana address format.", ephemeral=True)
             return
 
-        session = get_session()
         try:
-            player = session.query(FlexPlayer).filter_by(discord_id=interaction.user.id).first()
-            if not player:
-                player = FlexPlayer(discord_id=interaction.user.id)
-                session.add(player)
-            
-            player.wallet_address = address
-            session.commit()
+            previous_wallet = await repository.set_wallet(interaction.user.id, address)
+            invalidate_wallet(previous_wallet)
+            invalidate_wallet(address)
             await interaction.response.send_message(f"Wallet linked successfully: `{address}`", ephemeral=True)
         except Exception as e:
-            session.rollback()
+            mark_command_failed(interaction)
             await interaction.response.send_message(f"Error linking wallet: {e}", ephemeral=True)
-        finally:
-            session.close()
 
     @app_commands.command(name="unlink_wallet", description="Unlink your Solana wallet")
     async def unlink_wallet(self, interaction: discord.Interaction):
-        session = get_session()
         try:
-            player = session.query(FlexPlayer).filter_by(discord_id=interaction.user.id).first()
-            if player and player.wallet_address:
-                player.wallet_address = None
-                session.commit()
+            previous_wallet = await repository.set_wallet(interaction.user.id, None)
+            if previous_wallet:
+                invalidate_wallet(previous_wallet)
                 await interaction.response.send_message("Wallet unlinked successfully.", ephemeral=True)
             else:
                 await interaction.response.send_message("No wallet linked.", ephemeral=True)
         except Exception as e:
-            session.rollback()
+            mark_command_failed(interaction)
             await interaction.response.send_message(f"Error unlinking wallet: {e}", ephemeral=True)
-        finally:
-            session.close()
 
     @app_commands.command(name="view_wallet", description="View your linked wallet")
     async def view_wallet(self, interaction: discord.Interaction):
-        session = get_session()
-        try:
-            player = session.query(FlexPlayer).filter_by(discord_id=interaction.user.id).first()
-            if player and player.wallet_address:
-                await interaction.response.send_message(f"Linked Wallet: `{player.wallet_address}`", ephemeral=True)
-            else:
-                await interaction.response.send_message("No wallet linked. Use `/link_wallet` to link one.", ephemeral=True)
-        finally:
-            session.close()
+        wallet_address = await repository.get_wallet(interaction.user.id)
+        if wallet_address:
+            await interaction.response.send_message(f"Linked Wallet: `{wallet_address}`", ephemeral=True)
+        else:
+            await interaction.response.send_message("No wallet linked. Use `/link_wallet` to link one.", ephemeral=True)
 
 async def setup(bot):
     await bot.add_cog(Wallet(bot))
@@ -1,30 +1,127 @@
+import time
+STARTUP_STARTED = time.perf_counter()
+
+import contextlib
+import hashlib
+import json
 import os
+import sys
 import discord
+from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
-from shared.database import init_db
+from shared.database import init_db, dispose_engine
+from shared import repository
+from shared.repository import shutdown_db_executor
+from shared.http_client import start_http_session, close_http_session
+from shared.guild_config import load_guild_configs
+from shared.ownership_writer import ownership_writer
+from shared.sync_scheduler import sync_scheduler
+from shared.metrics import observe_interaction_end, observe_interaction_start, start_metrics_server, stop_metrics_server
 
 load_dotenv()
 
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 GUILD_ID = os.getenv("DISCORD_GUILD_ID")
+# Push the command tree to Discord on every start, even when its hash matches the last sync
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "false").lower() in ("1", "true", "yes")
 
 intents = discord.Intents.default()
 intents.message_content = True # Required for some commands if using prefix, but we are likely using slash commands
 intents.members = True
 
+class StartupTimer:
+    """
+    Wall-clock time per startup phase, printed once the bot first becomes ready.
+    """
+    def __init__(self, started: float):
+        self.started = started
+        self.phases = {} # name -> seconds, in the order they ran
+        self.reported = False
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        phase_started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - phase_started
+
+    def summary(self):
+        total = time.perf_counter() - self.started
+        # Whatever isn't a measured phase is the HTTP login and gateway handshake
+        phases = {**self.phases, "login": max(total - sum(self.phases.values()), 0.0)}
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items()) + f" (total {total:.2f}s)"
+
+startup_timer = StartupTimer(STARTUP_STARTED)
+startup_timer.phases["imports"] = time.perf_counter() - STARTUP_STARTED
+
+def command_tree_hash(tree: app_commands.CommandTree):
+    """
+    SHA-256 of the global command payloads Discord would receive from tree.sync().
+    """
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda command: (command.get("type", 1), command["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    """
+    Command tree that records per-command latency and errors for the metrics endpoint.
+    """
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        observe_interaction_start(interaction)
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        command_name = interaction.command.qualified_name if interaction.command else "unknown"
+        observe_interaction_end(interaction, command_name, failed=True)
+        await super().on_error(interaction, error)
+
 class CoreFlexbot(commands.Bot):
     def __init__(self):
-        super().__init__(command_prefix="!", intents=intents, help_command=None)
+        super().__init__(command_prefix="!", intents=intents, help_command=None, tree_cls=InstrumentedCommandTree)
+        self.exit_code = 0 # Process exit status once the bot has closed (1 asks Docker/Systemd for a restart)
 
     async def setup_hook(self):
+        with startup_timer.phase("setup"):
+            # Prometheus metrics endpoint (METRICS_PORT) and event-loop lag probe
+            try:
+                await start_metrics_server()
+            except OSError as e:
+                print(f"Metrics endpoint failed to start: {e}")
+
+            # Shared keep-alive HTTP client for Solana RPC and HowRare
+            await start_http_session()
+
+            # Write-behind flusher for ownership changes from /flex and the refresher
+            ownership_writer.start()
+
+            # Per-guild collection cache (shared by all cogs)
+            try:
+                count = await load_guild_configs()
+                print(f"Loaded collection config for {count} guild(s).")
+            except Exception as e:
+                print(f"Guild config load failed, using HOWRARE_COLLECTION for all guilds: {e}")
+
+            # Collection sync workers, the periodic schedule and resume of interrupted syncs
+            # (after the guild configs, so the first check sees every configured collection)
+            sync_scheduler.start()
+
         # Load Cogs
-        await self.load_extension("cogs.wallet")
-        await self.load_extension("cogs.flex")
-        await self.load_extension("cogs.admin")
-        await self.load_extension("cogs.help")
-        
-        # Sync commands
+        with startup_timer.phase("cogs"):
+            await self.load_extension("cogs.wallet")
+            await self.load_extension("cogs.flex")
+            await self.load_extension("cogs.admin")
+            await self.load_extension("cogs.ownership")
+            await self.load_extension("cogs.help")
+
+        with startup_timer.phase("command sync"):
+            await self.sync_commands()
+
+    async def sync_commands(self):
+        """
+        Pushes the command tree to Discord only when it differs from the last successful sync
+        (tracked by hash in flex_bot_state), since a global sync is slow and rate limited.
+        """
         # We sync globally so commands are available in all guilds the bot joins.
         # This can take up to 1 hour to propagate, but ensures multi-guild support.
         # If immediate testing is needed in a specific guild, uncomment the guild sync block below temporarily.
@@ -35,13 +132,51 @@ class CoreFlexbot(commands.Bot):
         #     await self.tree.sync(guild=guild)
         #     print(f"Commands synced to guild {GUILD_ID}")
         # else:
+        state_key = f"command_tree_hash:{self.application_id}"
+        tree_hash = command_tree_hash(self.tree)
+        try:
+            synced_hash = await repository.get_bot_state(state_key)
+        except Exception as e:
+            print(f"Could not read the last command sync hash, syncing: {e}")
+            synced_hash = None
+
+        if tree_hash == synced_hash and not FORCE_COMMAND_SYNC:
+            print("Command tree unchanged since the last sync; skipping sync.")
+            return
+
         print("Syncing commands globally (this may take up to 1 hour to propagate)...")
         await self.tree.sync()
-            
-        print("Bot is ready and commands synced.")
+        try:
+            await repository.set_bot_state(state_key, tree_hash)
+        except Exception as e:
+            print(f"Could not store the command sync hash: {e}")
+        print("Commands synced.")
+
+    async def close(self):
+        # Tear down before super().close(): once it returns, bot.run() finishes and asyncio.run()
+        # cancels whatever task is still in here (e.g. the /admin_stop interaction), dropping the flush
+        if not self.is_closed():
+            await sync_scheduler.stop()
+            await ownership_writer.stop()
+            await stop_metrics_server()
+            await close_http_session()
+        await super().close()
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        observe_interaction_end(interaction, command.qualified_name, failed=False)
 
     async def on_ready(self):
+        # Also fires after every gateway reconnect; only the first one ends startup
         print(f"Logged in as {self.user} (ID: {self.user.id})")
+        if not startup_timer.reported:
+            startup_timer.reported = True
+            print(f"Startup: {startup_timer.summary()}")
+
+def initialize_database():
+    """
+    Creates/migrates the schema once per process, before login, rather than on every on_ready.
+    """
+    with startup_timer.phase("db"):
         try:
             init_db()
             print("Database initialized.")
@@ -54,4 +189,9 @@ if __name__ == "__main__":
     if not TOKEN:
         print("Error: DISCORD_BOT_TOKEN not found in .env")
     else:
+        initialize_database()
         bot.run(TOKEN)
+        # Blocking teardown once the event loop is gone, so no DB call can still be in flight
+        shutdown_db_executor()
+        dispose_engine()
+        sys.exit(bot.exit_code)
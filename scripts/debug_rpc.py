@@ -1,6 +1,7 @@
 import asyncio
 import os
 from shared.solana_utils import get_assets_by_owner
+from shared.http_client import close_http_session
 from shared.database import get_session, FlexNFT
 
 WALLET = "GQtVDQnNCcpYCbpneEw675ufsGbJQkJzLtSHPWXLQAUP"
@@ -12,6 +13,7 @@ async def main():
     # 1. Check RPC
     print("Fetching assets from RPC...")
     assets = await get_assets_by_owner(WALLET)
+    await close_http_session()
     print(f"RPC returned {len(assets)} assets.")
     
     if assets:
@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import os
+import time
+from collections import OrderedDict
+from shared.solana_utils import fetch_assets_by_owner
+from shared.trait_index import trait_index_cache
+from shared.metrics import Gauge
+
+# In-process cache in front of fetch_assets_by_owner, keyed by (wallet, collection address).
+# Concurrent lookups for the same key share one in-flight RPC call instead of each issuing their own.
+
+ASSET_CACHE_TTL = float(os.getenv("ASSET_CACHE_TTL", "60"))
+ASSET_CACHE_MAX_ENTRIES = int(os.getenv("ASSET_CACHE_MAX_ENTRIES", "2000"))
+
+class AssetCache:
+    """
+    TTL + LRU cache of wallet asset lists with single-flight loading.
+    RPC errors propagate to every waiting caller and are not cached.
+    Cached lists are shared between callers and must not be mutated.
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key -> (expires_at, assets)
+        self._inflight = {} # key -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get(self, wallet_address: str, collection_address: str, loader):
+        key = (wallet_address, collection_address)
+        entry = self._entries.get(key)
+        if entry:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(loader(wallet_address, collection_address))
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._on_loaded, key))
+
+        # Shield so one cancelled interaction doesn't cancel the lookup for everyone waiting on it
+        return await asyncio.shield(task)
+
+    def _on_loaded(self, key, task):
+        if self._inflight.get(key) is not task:
+            return # Invalidated while loading; don't cache possibly stale data
+        del self._inflight[key]
+        if task.cancelled() or task.exception():
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_wallet(self, wallet_address: str):
+        """
+        Drops every cached and in-flight entry for a wallet (all collections).
+        """
+        if not wallet_address:
+            return
+        for key in [key for key in self._entries if key[0] == wallet_address]:
+            del self._entries[key]
+        for key in [key for key in self._inflight if key[0] == wallet_address]:
+            del self._inflight[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+asset_cache = AssetCache(ASSET_CACHE_TTL, ASSET_CACHE_MAX_ENTRIES)
+Gauge("flexbot_asset_cache_hit_ratio", "Asset cache hits (incl. coalesced) per lookup", callback=lambda: asset_cache.stats()["hit_rate"])
+
+async def get_cached_assets_by_owner(wallet_address: str, collection_address: str = None):
+    """
+    Cached, coalesced version of fetch_assets_by_owner (raises on RPC errors).
+    """
+    return await asset_cache.get(wallet_address, collection_address, fetch_assets_by_owner)
+
+def invalidate_wallet(wallet_address: str):
+    """
+    Drops everything cached in-process for a wallet (assets and its trait index).
+    Call when a wallet is linked, unlinked or its holdings are known to have changed.
+    """
+    asset_cache.invalidate_wallet(wallet_address)
+    trait_index_cache.invalidate_wallet(wallet_address)
@@ -0,0 +1,334 @@
+import contextlib
+import hashlib
+import json
+import os
+import time
+import ijson
+from sqlalchemy import select
+from shared.database import dialect_insert, get_session, refresh_holder_stats, replace_traits, FlexNFT
+from shared.rarity_config import get_tier_name
+from shared.repository import run_db
+from shared.http_client import get_http_session
+from shared.metrics import HOWRARE_SECONDS, SYNC_ITEMS, SYNC_ITEMS_PER_SECOND
+from shared.sync_jobs import advance_sync_job, finish_sync_job, reset_sync_job, start_sync_job
+
+# Shared HowRare -> FlexNFT sync used by the admin command, the auto-sync task and scripts/sync_db_manual.py.
+# Items are written with one multi-row INSERT ... ON CONFLICT (mint) DO UPDATE per batch instead of a
+# SELECT + ORM flush per NFT. Each row carries a content fingerprint, so items HowRare returned
+# unchanged are skipped entirely and only new or changed rows are written.
+
+HOWRARE_API_BASE = os.getenv("HOWRARE_API_BASE", "https://api.howrare.is/v0.1")
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "500"))
+SYNC_STREAMING = os.getenv("SYNC_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# ijson path of each element of result.data.items in the /collections/{slug} payload
+HOWRARE_ITEMS_PREFIX = "result.data.items.item"
+
+class CollectionSyncError(Exception):
+    pass
+
+class SyncResumeMismatch(Exception):
+    """
+    The source no longer lines up with a resumed job's cursor (items were added, removed or reordered).
+    """
+
+def new_sync_stats():
+    return {
+        "processed": 0, "inserted": 0, "updated": 0, "unchanged": 0, "stopped": False,
+        "job_id": None, "resumed_from": 0, # Source position a resumed job continued from
+        # Delta since the last sync
+        "new_mints": [], "rank_changes": [], "removed_mints": [],
+    }
+
+def format_sync_stats(stats):
+    return (f"{stats['processed']} processed: {stats['inserted']} inserted, "
+            f"{stats['updated']} updated, {stats['unchanged']} unchanged")
+
+def format_sync_delta(stats, limit: int = 5):
+    """
+    Human readable "delta since last sync": new mints, rank changes and removed mints.
+    """
+    lines = [
+        f"New mints: {len(stats['new_mints'])}",
+        f"Rank changes: {len(stats['rank_changes'])}",
+        f"Removed mints: {len(stats['removed_mints'])}",
+    ]
+    # Largest rank moves first
+    moves = sorted(stats['rank_changes'], key=lambda change: abs((change[2] or 0) - (change[1] or 0)), reverse=True)
+    for mint, old_rank, new_rank in moves[:limit]:
+        lines.append(f"  {mint[:8]}...: #{old_rank} -> #{new_rank}")
+    return "\n".join(lines)
+
+def compute_content_hash(row):
+    """
+    Fingerprint of the HowRare-sourced fields of a FlexNFT row (plus the derived tier, so a
+    rarity config change rewrites the affected rows on the next sync).
+    """
+    payload = json.dumps(
+        [row["collection_slug"], row["name"], row["rank"], row["image_url"], row["attributes"], row["tier"]],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _item_to_row(collection_slug, item, now):
+    row = {
+        "mint": item.get('mint'),
+        "collection_slug": collection_slug,
+        "name": item.get('name'),
+        "rank": item.get('rank'),
+        "image_url": item.get('image'),
+        "attributes": item.get('attributes'),
+        "last_updated": now,
+    }
+    row["tier"] = get_tier_name(row["rank"], row["attributes"], collection_slug)
+    row["content_hash"] = compute_content_hash(row)
+    return row
+
+def _upsert_batch(collection_slug, items, checkpoint=None):
+    """
+    Upserts one batch of HowRare items, writing only rows whose fingerprint changed.
+    With a checkpoint, the sync job's cursor and counts are advanced in the same transaction.
+    Returns per-batch counts plus the new mints and rank changes seen in the batch.
+    """
+    now = time.time()
+    # De-duplicate by mint (last wins); ON CONFLICT cannot touch the same row twice in one statement
+    rows = {}
+    for item in items:
+        if item.get('mint'):
+            rows[item['mint']] = _item_to_row(collection_slug, item, now)
+
+    result = {"processed": len(rows), "inserted": 0, "updated": 0, "unchanged": 0, "new_mints": [], "rank_changes": []}
+    if not rows and checkpoint is None:
+        return result
+
+    session = get_session()
+    try:
+        table = FlexNFT.__table__
+        stored = {}
+        if rows:
+            stored = {
+                mint: (rank, content_hash)
+                for mint, rank, content_hash in session.execute(
+                    select(table.c.mint, table.c.rank, table.c.content_hash).where(table.c.mint.in_(list(rows.keys())))
+                )
+            }
+
+        changed = [row for mint, row in rows.items() if mint not in stored or stored[mint][1] != row["content_hash"]]
+        result["unchanged"] = len(rows) - len(changed)
+
+        if changed:
+            insert = dialect_insert(session)
+            stmt = insert(table).values(changed)
+            excluded = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.mint],
+                set_={
+                    "collection_slug": excluded.collection_slug,
+                    "name": excluded.name,
+                    "rank": excluded.rank,
+                    "image_url": excluded.image_url,
+                    "attributes": excluded.attributes,
+                    "last_updated": excluded.last_updated,
+                    "content_hash": excluded.content_hash,
+                    "tier": excluded.tier,
+                },
+                # Guards against a concurrent writer having stored the same content already
+                where=table.c.content_hash.is_distinct_from(excluded.content_hash),
+            ).returning(table.c.mint)
+
+            written = set(session.execute(stmt).scalars())
+            # Keep the normalized trait table in step with the rows actually written
+            replace_traits(session, {mint: rows[mint]["attributes"] for mint in written})
+            # Rank and tier feed the leaderboard, so refresh the stats of whoever holds the written mints
+            if written:
+                refresh_holder_stats(session, session.execute(
+                    select(table.c.collection_slug, table.c.owner_wallet).where(
+                        table.c.mint.in_(list(written)), table.c.owner_wallet.isnot(None)
+                    ).distinct()
+                ).all())
+
+            for mint in written:
+                row = rows[mint]
+                if mint not in stored:
+                    result["inserted"] += 1
+                    result["new_mints"].append(mint)
+                else:
+                    result["updated"] += 1
+                    old_rank = stored[mint][0]
+                    if old_rank != row["rank"]:
+                        result["rank_changes"].append((mint, old_rank, row["rank"]))
+            result["unchanged"] += len(changed) - len(written)
+
+        if checkpoint is not None:
+            advance_sync_job(session, checkpoint, result)
+        session.commit()
+        return result
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _find_removed_mints(collection_slug, seen_mints):
+    session = get_session()
+    try:
+        stored = session.execute(select(FlexNFT.mint).where(FlexNFT.collection_slug == collection_slug)).scalars()
+        return sorted(mint for mint in stored if mint not in seen_mints)
+    finally:
+        session.close()
+
+async def fetch_collection_items(collection_slug: str):
+    """
+    Downloads the full item list for a collection from HowRare in one piece.
+    """
+    url = f"{HOWRARE_API_BASE}/collections/{collection_slug}"
+    with HOWRARE_SECONDS.time(mode="full"):
+        async with get_http_session().get(url) as response:
+            if response.status != 200:
+                raise CollectionSyncError(f"Error fetching collection {collection_slug}: {response.status}")
+            data = await response.json()
+
+    return data.get('result', {}).get('data', {}).get('items', [])
+
+async def stream_collection_batches(collection_slug: str, batch_size: int = SYNC_BATCH_SIZE):
+    """
+    Async generator yielding lists of at most batch_size items, parsed incrementally from the
+    HowRare response body. Only the current batch is held in memory, never the whole payload.
+    """
+    url = f"{HOWRARE_API_BASE}/collections/{collection_slug}"
+    with HOWRARE_SECONDS.time(mode="stream"):
+        response = await get_http_session().get(url)
+        if response.status != 200:
+            response.release()
+            raise CollectionSyncError(f"Error fetching collection {collection_slug}: {response.status}")
+
+    async with response:
+        batch = []
+        async for item in ijson.items_async(response.content, HOWRARE_ITEMS_PREFIX, use_float=True):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+async def _iter_list_batches(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+async def sync_collection_batches(collection_slug: str, batches, should_stop=None, on_progress=None, total=None, job=None):
+    """
+    Writes batches of HowRare items (any async iterable of lists) to FlexNFT, skipping unchanged items.
+
+    should_stop: optional callable checked between batches; returning True halts the sync.
+    on_progress: optional coroutine function called with (stats, total) after each batch.
+                 total is None when the item count is not known up front (streaming).
+    job: optional sync job (see shared/sync_jobs.py). Each batch checkpoints the job, and the first
+         job['cursor'] items are skipped (only their mints are collected) since they were already
+         committed; raises SyncResumeMismatch if the item before the cursor isn't job['last_mint'].
+    Returns a stats dict with processed/inserted/updated/unchanged counts (including a resumed job's
+    earlier progress) and the delta since the last sync (new_mints, rank_changes, removed_mints).
+    The delta only covers items written in this run. Removed mints are only computed for a
+    complete run and are reported, not deleted.
+    Raises CollectionSyncError if the source yielded no items.
+    """
+    stats = new_sync_stats()
+    seen_mints = set()
+    started = time.monotonic()
+    skip = 0
+    if job:
+        for key in ("processed", "inserted", "updated", "unchanged"):
+            stats[key] = job[key]
+        stats["job_id"] = job["id"]
+        stats["resumed_from"] = skip = job["cursor"]
+    processed_before = stats["processed"]
+    position = 0 # Source items consumed so far
+    last_checkpoint = started
+
+    async with contextlib.aclosing(batches):
+        async for batch in batches:
+            if should_stop and should_stop():
+                stats["stopped"] = True
+                break
+
+            if position < skip:
+                # Committed by an earlier run of this job; only needed for removed-mint detection
+                skipped = batch[:skip - position]
+                seen_mints.update(item['mint'] for item in skipped if item.get('mint'))
+                position += len(skipped)
+                if position == skip and skipped[-1].get('mint') != job['last_mint']:
+                    raise SyncResumeMismatch(f"Item {skip} of {collection_slug} is no longer {job['last_mint']}")
+                batch = batch[len(skipped):]
+                if not batch:
+                    continue
+
+            seen_mints.update(item['mint'] for item in batch if item.get('mint'))
+            position += len(batch)
+            checkpoint = None
+            if job:
+                now = time.monotonic()
+                checkpoint = {"job_id": job["id"], "cursor": position, "last_mint": batch[-1].get('mint'), "elapsed": now - last_checkpoint}
+                last_checkpoint = now
+            batch_stats = await run_db(_upsert_batch, collection_slug, batch, checkpoint)
+            for key, value in batch_stats.items():
+                stats[key] += value
+
+            if on_progress:
+                await on_progress(stats, total)
+
+    elapsed = time.monotonic() - started
+    processed = stats["processed"] - processed_before
+    SYNC_ITEMS.inc(processed, collection=collection_slug)
+    SYNC_ITEMS_PER_SECOND.set(processed / elapsed if elapsed > 0 else 0.0, collection=collection_slug)
+
+    if stats["stopped"]:
+        return stats
+    if position < skip:
+        raise SyncResumeMismatch(f"{collection_slug} now has {position} items, fewer than the resume point {skip}")
+    if not stats["processed"]:
+        raise CollectionSyncError(f"No items found for {collection_slug}")
+
+    stats["removed_mints"] = await run_db(_find_removed_mints, collection_slug, seen_mints)
+    return stats
+
+async def sync_collection_items(collection_slug: str, items: list, batch_size: int = SYNC_BATCH_SIZE, should_stop=None, on_progress=None, job=None):
+    """
+    Writes an in-memory list of HowRare items. See sync_collection_batches.
+    """
+    batches = _iter_list_batches(items, batch_size)
+    return await sync_collection_batches(collection_slug, batches, should_stop=should_stop, on_progress=on_progress, total=len(items), job=job)
+
+async def _run_sync(collection_slug, batch_size, should_stop, on_progress, streaming, job):
+    if streaming:
+        batches = stream_collection_batches(collection_slug, batch_size)
+        return await sync_collection_batches(collection_slug, batches, should_stop=should_stop, on_progress=on_progress, job=job)
+
+    items = await fetch_collection_items(collection_slug)
+    return await sync_collection_items(collection_slug, items, batch_size=batch_size, should_stop=should_stop, on_progress=on_progress, job=job)
+
+async def sync_collection(collection_slug: str, batch_size: int = SYNC_BATCH_SIZE, should_stop=None, on_progress=None, streaming: bool = SYNC_STREAMING, trigger: str = "manual", resume: bool = True):
+    """
+    Fetches a collection from HowRare and upserts it into the local database.
+    With streaming (the default), items are parsed from the response as they arrive and written
+    batch by batch, so peak memory is bounded by batch_size rather than collection size.
+
+    Progress is recorded as a sync job (flex_sync_jobs). With resume, a stopped, failed or
+    interrupted job for the collection continues after its last committed batch: HowRare has no
+    paging, so the payload is downloaded again but the committed items are not rewritten.
+    If the payload no longer lines up with the job's cursor, the job restarts from the first item.
+    Raises CollectionSyncError if HowRare returns an error or no items.
+    """
+    job = await start_sync_job(collection_slug, trigger, resume)
+    try:
+        try:
+            stats = await _run_sync(collection_slug, batch_size, should_stop, on_progress, streaming, job)
+        except SyncResumeMismatch as e:
+            print(f"Cannot resume sync job {job['id']}: {e}. Restarting from the first item.")
+            job = await reset_sync_job(job["id"])
+            stats = await _run_sync(collection_slug, batch_size, should_stop, on_progress, streaming, job)
+    except Exception as e:
+        await finish_sync_job(job["id"], "failed", error=str(e))
+        raise
+
+    await finish_sync_job(job["id"], "stopped" if stats["stopped"] else "completed")
+    return stats
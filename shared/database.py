@@ -1,13 +1,25 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, BigInteger, JSON, Float
+import threading
+import time
+from sqlalchemy import create_engine, func, inspect, select, text, Column, Index, Integer, String, BigInteger, JSON, Float
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
+from shared.metrics import Gauge
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Connection pool tuning (shared by every cog and script in this process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
 Base = declarative_base()
 
 # Using 'flex_' prefix to ensure clean separation from other projects in the same DB
@@ -37,18 +49,396 @@ class FlexNFT(Base):
     attributes = Column(JSON, nullable=True) # Stores list of {name, value, rarity}
     owner_wallet = Column(String, nullable=True, index=True)
     last_updated = Column(Float, nullable=True) # Timestamp
+    content_hash = Column(String(40), nullable=True) # Fingerprint of the synced HowRare fields
+    tier = Column(String, nullable=True) # Rarity tier from shared/rarity_config.py, set on write
+
+    __table_args__ = (
+        Index('ix_flex_nfts_collection_tier', 'collection_slug', 'tier'),
+    )
+
+class FlexNFTTrait(Base):
+    """
+    One row per (mint, trait_type, value), normalized from FlexNFT.attributes so trait filters,
+    counts and autocomplete are indexed queries instead of Python scans over JSON.
+    Kept in step with FlexNFT by the collection sync and the /flex ownership writes.
+    """
+    __tablename__ = 'flex_nft_traits'
+
+    mint = Column(String, primary_key=True)
+    trait_type = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+
+    __table_args__ = (
+        Index('ix_flex_nft_traits_type_value', 'trait_type', 'value'),
+        Index('ix_flex_nft_traits_mint', 'mint'),
+    )
+
+class FlexWalletRefresh(Base):
+    """
+    When a wallet's ownership was last reconciled against the chain, per collection.
+    /flex answers from the local DB while this is within OWNERSHIP_MAX_STALENESS.
+    """
+    __tablename__ = 'flex_wallet_refresh'
+
+    wallet_address = Column(String, primary_key=True)
+    collection_slug = Column(String, primary_key=True)
+    refreshed_at = Column(Float, nullable=False, index=True) # Timestamp
+
+class FlexHolderStats(Base):
+    """
+    Per-holder aggregates for a collection (NFT count, best rank, NFTs per tier) behind /flex_leaderboard.
+    Recomputed for the affected holders whenever ownership, rank or tier changes (see refresh_holder_stats),
+    so the leaderboard is a paginated read instead of a GROUP BY over the whole collection.
+    """
+    __tablename__ = 'flex_holder_stats'
+
+    collection_slug = Column(String, primary_key=True)
+    owner_wallet = Column(String, primary_key=True)
+    nft_count = Column(Integer, nullable=False)
+    best_rank = Column(Integer, nullable=True)
+    tier_counts = Column(JSON, nullable=True) # {tier: count}
+    updated_at = Column(Float, nullable=True) # Timestamp
+
+    __table_args__ = (
+        Index('ix_flex_holder_stats_collection_count', 'collection_slug', 'nft_count'),
+        Index('ix_flex_holder_stats_collection_best_rank', 'collection_slug', 'best_rank'),
+    )
+
+class FlexRoleRule(Base):
+    """
+    Holder role rule for a guild: members holding at least `min_count` NFTs of the guild's collection
+    (only counting `tier` when set) get `role_id`; the role is removed when they no longer qualify.
+    """
+    __tablename__ = 'flex_role_rules'
+
+    id = Column(Integer, primary_key=True)
+    guild_id = Column(BigInteger, nullable=False, index=True)
+    role_id = Column(BigInteger, nullable=False)
+    min_count = Column(Integer, nullable=False, default=1)
+    tier = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index('ix_flex_role_rules_guild_role', 'guild_id', 'role_id', unique=True),
+    )
+
+class FlexSyncJob(Base):
+    """
+    One HowRare -> FlexNFT sync run. `cursor` counts source items committed so far (advanced in the
+    same transaction as each batch) and `last_mint` is the mint just before it, so an interrupted
+    or stopped job resumes after its last committed batch. See shared/sync_jobs.py.
+    """
+    __tablename__ = 'flex_sync_jobs'
+
+    id = Column(Integer, primary_key=True)
+    collection_slug = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False, index=True) # running, completed, stopped, failed, superseded
+    trigger = Column(String, nullable=True) # admin, schedule, script, resume
+    cursor = Column(Integer, nullable=False, default=0)
+    last_mint = Column(String, nullable=True)
+    total_items = Column(Integer, nullable=True) # Known up front only for non-streaming runs, set on completion otherwise
+    processed = Column(Integer, nullable=False, default=0)
+    inserted = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    unchanged = Column(Integer, nullable=False, default=0)
+    active_seconds = Column(Float, nullable=False, default=0.0) # Time spent syncing, summed over resumes
+    resumes = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    started_at = Column(Float, nullable=False) # Timestamp
+    updated_at = Column(Float, nullable=True) # Timestamp of the last checkpoint (heartbeat)
+    finished_at = Column(Float, nullable=True) # Timestamp
+
+class FlexSyncLease(Base):
+    """
+    Which process currently owns a collection's sync. Taken with a conditional upsert and renewed
+    while the sync runs, so bot replicas and scripts sharing the database never sync the same
+    collection at once; an owner that dies stops renewing and the lease expires.
+    """
+    __tablename__ = 'flex_sync_leases'
+
+    collection_slug = Column(String, primary_key=True)
+    owner = Column(String, nullable=False) # host:pid:nonce of the holder
+    acquired_at = Column(Float, nullable=False) # Timestamp
+    expires_at = Column(Float, nullable=False) # Timestamp
+
+class FlexBotState(Base):
+    """
+    Small key/value store for bot bookkeeping that has to survive restarts,
+    such as the hash of the last command tree pushed to Discord.
+    """
+    __tablename__ = 'flex_bot_state'
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+    updated_at = Column(Float, nullable=True) # Timestamp
+
+def dialect_insert(session):
+    """
+    Returns the dialect-specific insert() (supporting on_conflict_do_update) for the session's database.
+    """
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        return postgresql.insert
+    if dialect_name == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"Upserts are not supported on the '{dialect_name}' dialect")
+
+def attributes_to_traits(mint, attributes):
+    """
+    Normalizes an attributes list into FlexNFTTrait rows (as dicts).
+    HowRare uses {name, value}; DAS metadata uses {trait_type, value}. Both are accepted.
+    """
+    traits = {}
+    for attr in attributes or []:
+        if not isinstance(attr, dict):
+            continue
+        trait_type = attr.get('name') or attr.get('trait_type')
+        value = attr.get('value')
+        if trait_type and value not in (None, ""):
+            traits[(str(trait_type), str(value))] = {"mint": mint, "trait_type": str(trait_type), "value": str(value)}
+    return list(traits.values())
+
+def replace_traits(session, attributes_by_mint):
+    """
+    Rewrites the trait rows for the given {mint: attributes} within the caller's transaction.
+    """
+    if not attributes_by_mint:
+        return
+    table = FlexNFTTrait.__table__
+    session.execute(table.delete().where(table.c.mint.in_(list(attributes_by_mint.keys()))))
+    rows = [row for mint, attributes in attributes_by_mint.items() for row in attributes_to_traits(mint, attributes)]
+    if rows:
+        # A concurrent rewrite of the same mint (sync batch vs. ownership flush) may have inserted
+        # identical rows after our delete; skip those instead of failing on the primary key
+        stmt = dialect_insert(session)(table).on_conflict_do_nothing(index_elements=[table.c.mint, table.c.trait_type, table.c.value])
+        session.execute(stmt, rows)
+
+def refresh_holder_stats(session, holders):
+    """
+    Recomputes FlexHolderStats for the given {(collection_slug, owner_wallet)} within the caller's
+    transaction. Holders left with no NFTs are removed.
+    """
+    holders = {(collection_slug, wallet) for collection_slug, wallet in holders if collection_slug and wallet}
+    if not holders:
+        return
+
+    by_collection = {}
+    for collection_slug, wallet in holders:
+        by_collection.setdefault(collection_slug, set()).add(wallet)
+
+    now = time.time()
+    for collection_slug, wallets in by_collection.items():
+        wallets = list(wallets)
+        rows = session.execute(
+            select(FlexNFT.owner_wallet, FlexNFT.tier, func.count(), func.min(FlexNFT.rank)).where(
+                FlexNFT.collection_slug == collection_slug, FlexNFT.owner_wallet.in_(wallets)
+            ).group_by(FlexNFT.owner_wallet, FlexNFT.tier)
+        ).all()
+
+        stats = {}
+        for wallet, tier, count, best_rank in rows:
+            entry = stats.setdefault(wallet, {"collection_slug": collection_slug, "owner_wallet": wallet, "nft_count": 0, "best_rank": None, "tier_counts": {}, "updated_at": now})
+            entry["nft_count"] += count
+            if best_rank is not None and (entry["best_rank"] is None or best_rank < entry["best_rank"]):
+                entry["best_rank"] = best_rank
+            if tier:
+                entry["tier_counts"][tier] = count
+
+        table = FlexHolderStats.__table__
+        # Upsert rather than delete + insert: two transactions refreshing the same holder (an ownership
+        # flush and a sync batch) would otherwise both delete, and the second insert hit the primary key
+        if stats:
+            stmt = dialect_insert(session)(table).values([stats[wallet] for wallet in sorted(stats)])
+            excluded = stmt.excluded
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.collection_slug, table.c.owner_wallet],
+                set_={column: excluded[column] for column in ("nft_count", "best_rank", "tier_counts", "updated_at")},
+            ))
+        emptied = [wallet for wallet in wallets if wallet not in stats]
+        if emptied:
+            session.execute(table.delete().where(table.c.collection_slug == collection_slug, table.c.owner_wallet.in_(emptied)))
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long callers wait to check out a connection.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkout_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkout_count += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+
+_engine = None
+_Session = None
+_engine_lock = threading.Lock()
 
-    
 def get_engine():
+    """
+    Returns the process-wide engine, creating it (and its connection pool) on first use.
+    """
+    global _engine, _Session
+    if _engine is not None:
+        return _engine
+
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL is not set in .env")
-    return create_engine(DATABASE_URL)
+
+    with _engine_lock:
+        if _engine is None:
+            if DATABASE_URL.startswith("sqlite"):
+                # SQLite has no server connections to pool
+                engine = create_engine(DATABASE_URL)
+            else:
+                engine = create_engine(
+                    DATABASE_URL,
+                    poolclass=TimedQueuePool,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=DB_POOL_PRE_PING,
+                )
+            _Session = sessionmaker(bind=engine)
+            _engine = engine
+    return _engine
 
 def get_session():
-    engine = get_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    if _Session is None:
+        get_engine()
+    return _Session()
+
+def get_pool_stats():
+    """
+    Returns a snapshot of the connection pool: size, checked-out/idle connections,
+    overflow in use and how long callers have waited for a connection.
+    """
+    if _engine is None:
+        return {"initialized": False}
+
+    pool = _engine.pool
+    stats = {"initialized": True, "pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": DB_MAX_OVERFLOW,
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            checkouts = pool.checkout_count
+            stats.update({
+                "checkouts": checkouts,
+                "avg_wait_ms": (pool.total_wait / checkouts * 1000) if checkouts else 0.0,
+                "max_wait_ms": pool.max_wait * 1000,
+            })
+    return stats
+
+POOL_CHECKED_OUT = Gauge(
+    "flexbot_db_pool_checked_out", "Database connections currently checked out",
+    callback=lambda: get_pool_stats().get("checked_out")
+)
+
+def dispose_engine():
+    """
+    Closes all pooled connections. Call on shutdown or at the end of a script.
+    """
+    global _engine, _Session
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _Session = None
+
+def _add_missing_columns(engine):
+    """
+    create_all() only creates missing tables, so add columns introduced after a table
+    was first created. New columns must be nullable.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"Added column {table.name}.{column.name}")
+                for index in table.indexes:
+                    if column.name in index.columns:
+                        index.create(conn, checkfirst=True)
+
+def _backfill_traits(engine, chunk_size=2000):
+    """
+    Populates flex_nft_traits from existing FlexNFT rows the first time the table is empty.
+    """
+    session = sessionmaker(bind=engine)()
+    try:
+        if session.query(FlexNFTTrait.mint).first() is not None:
+            return
+        count = 0
+        last_mint = ""
+        while True:
+            rows = session.execute(
+                select(FlexNFT.mint, FlexNFT.attributes).where(FlexNFT.mint > last_mint).order_by(FlexNFT.mint).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            replace_traits(session, {mint: attributes for mint, attributes in rows})
+            count += len(rows)
+            last_mint = rows[-1][0]
+        # Single commit so an interrupted backfill is retried in full on the next start
+        session.commit()
+        if count:
+            print(f"Backfilled traits for {count} NFTs.")
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _backfill_holder_stats(engine):
+    """
+    Populates flex_holder_stats from existing ownership the first time the table is empty.
+    """
+    session = sessionmaker(bind=engine)()
+    try:
+        if session.query(FlexHolderStats.owner_wallet).first() is not None:
+            return
+        holders = session.execute(
+            select(FlexNFT.collection_slug, FlexNFT.owner_wallet).where(FlexNFT.owner_wallet.isnot(None)).distinct()
+        ).all()
+        if not holders:
+            return
+        refresh_holder_stats(session, holders)
+        session.commit()
+        print(f"Backfilled holder stats for {len(holders)} holders.")
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
 def init_db():
     engine = get_engine()
     Base.metadata.create_all(engine)
+    _add_missing_columns(engine)
+    _backfill_traits(engine)
+    _backfill_holder_stats(engine)
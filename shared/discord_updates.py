@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from collections import deque
+import discord
+from shared.metrics import Gauge
+
+# Outbound scheduler for message edits and followups.
+# Every call goes through a per-route queue (one channel or one interaction webhook) that spaces
+# requests at least DISCORD_ROUTE_INTERVAL apart, so bulk jobs don't burst into 429s. Edits to the
+# same message are merged while queued: only the latest content is sent. edit() never blocks, so
+# long-running jobs can report progress without waiting on Discord.
+
+DISCORD_ROUTE_INTERVAL = float(os.getenv("DISCORD_ROUTE_INTERVAL", "1.0"))
+
+def interaction_route(interaction: discord.Interaction) -> str:
+    """
+    Route key for an interaction's followups and their edits (they share the interaction webhook).
+    """
+    return f"interaction:{interaction.id}"
+
+class _Route:
+    def __init__(self):
+        self.queue = deque() # ("edit", message_id) or ("call", (func, args, kwargs, future))
+        self.edits = {} # message_id -> (message, fields); latest fields win
+        self.next_at = 0.0
+        self.task = None
+
+class DiscordUpdateQueue:
+    """
+    Per-route FIFO of outbound Discord calls with edit coalescing and request spacing.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._routes = {} # route key -> _Route
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def _route(self, key: str):
+        route = self._routes.get(key)
+        if route is None:
+            route = self._routes[key] = _Route()
+        if route.task is None or route.task.done():
+            route.task = asyncio.create_task(self._drain(key, route))
+        return route
+
+    def edit(self, message, route: str = None, **fields):
+        """
+        Queues message.edit(**fields) without waiting. A pending edit of the same message is replaced.
+        """
+        route_obj = self._route(route or f"channel:{message.channel.id}")
+        if message.id in route_obj.edits:
+            self.coalesced += 1
+        else:
+            route_obj.queue.append(("edit", message.id))
+        route_obj.edits[message.id] = (message, fields)
+
+    async def send(self, route: str, func, *args, **kwargs):
+        """
+        Queues func(*args, **kwargs) (e.g. interaction.followup.send) behind the route's earlier
+        calls and returns its result once it has been sent.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._route(route).queue.append(("call", (func, args, kwargs, future)))
+        return await future
+
+    async def _drain(self, key: str, route: _Route):
+        while True:
+            # Wait out the spacing even when idle, so a call arriving right after the last one is still paced
+            delay = route.next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not route.queue:
+                break
+
+            kind, item = route.queue.popleft()
+            if kind == "edit":
+                message, fields = route.edits.pop(item)
+                func, args, kwargs, future = message.edit, (), fields, None
+            else:
+                func, args, kwargs, future = item
+                if future.cancelled():
+                    continue
+
+            try:
+                result = await func(*args, **kwargs)
+                self.sent += 1
+                if future is not None and not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                self.failed += 1
+                if future is not None and not future.done():
+                    future.set_exception(e)
+                else:
+                    print(f"Discord update on {key} failed: {e}")
+            route.next_at = time.monotonic() + self.interval
+
+        if self._routes.get(key) is route:
+            del self._routes[key]
+
+    def depth(self):
+        return sum(len(route.queue) for route in self._routes.values())
+
+    def stats(self):
+        return {
+            "queued": self.depth(),
+            "routes": len(self._routes),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+        }
+
+discord_updates = DiscordUpdateQueue(DISCORD_ROUTE_INTERVAL)
+Gauge("flexbot_discord_updates_queued", "Outbound Discord calls waiting in the update queue", callback=discord_updates.depth)
@@ -0,0 +1,39 @@
+import os
+from shared import repository
+
+# In-memory cache of FlexGuildConfig so hot commands resolve a guild's collection without a DB query.
+# Loaded once at startup and updated in place by /admin_set_collection; guilds without a row use
+# the HOWRARE_COLLECTION environment default.
+
+DEFAULT_COLLECTION = os.getenv("HOWRARE_COLLECTION", "the_growerz")
+
+_guild_collections = {} # guild_id -> collection_slug
+
+async def load_guild_configs():
+    """
+    (Re)loads every guild's collection from the database. Called from CoreFlexbot.setup_hook.
+    """
+    global _guild_collections
+    _guild_collections = await repository.get_all_guild_collections()
+    return len(_guild_collections)
+
+def get_guild_collection(guild_id: int) -> str:
+    """
+    Collection slug for a guild (no database access). DMs and unconfigured guilds get the default.
+    """
+    if guild_id is None:
+        return DEFAULT_COLLECTION
+    return _guild_collections.get(guild_id, DEFAULT_COLLECTION)
+
+async def set_guild_collection(guild_id: int, collection_slug: str):
+    """
+    Persists a guild's collection and updates the cache.
+    """
+    await repository.set_guild_collection(guild_id, collection_slug)
+    _guild_collections[guild_id] = collection_slug
+
+def get_configured_collections():
+    """
+    Every collection in use by this process: the default plus all guild overrides.
+    """
+    return {DEFAULT_COLLECTION, *_guild_collections.values()}
@@ -0,0 +1,50 @@
+import os
+import aiohttp
+
+# One aiohttp session for the lifetime of the bot (or script), shared by Solana RPC and HowRare calls.
+# Reusing it keeps TCP/TLS connections alive between requests and caches DNS lookups, so a /flex
+# does not pay for a fresh handshake with the RPC provider.
+
+HTTP_CONNECTION_LIMIT = int(os.getenv("HTTP_CONNECTION_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+# Per-request budget for Solana RPC calls (large HowRare downloads are only bound by the read timeout)
+RPC_TIMEOUT = aiohttp.ClientTimeout(total=float(os.getenv("RPC_TIMEOUT", "15")))
+
+_session = None
+
+def _create_session():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_CONNECTION_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    timeout = aiohttp.ClientTimeout(total=None, connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+async def start_http_session():
+    """
+    Creates the shared session. Called from CoreFlexbot.setup_hook.
+    """
+    get_http_session()
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Returns the shared session, creating it on first use (scripts don't call start_http_session).
+    Must be called from a running event loop.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+async def close_http_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+import aiohttp
+from shared import repository
+from shared.http_client import get_http_session
+from shared.metrics import Gauge
+
+try:
+    from PIL import Image
+except ImportError: # Pillow is optional; without it images are cached at their original size
+    Image = None
+
+# Local artwork cache for /flex.
+# NFT image links often point at slow IPFS/Arweave gateways. Images are downloaded ahead of time
+# (after a collection sync, or on first /flex), shrunk to IMAGE_MAX_SIZE and stored under
+# IMAGE_CACHE_DIR/objects named by the SHA-256 of their bytes; refs/<sha1(url)> maps a source URL
+# to its object. Total object size is capped at IMAGE_CACHE_MAX_BYTES by evicting least recently used
+# objects (and their refs).
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache") # Empty disables the cache
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+IMAGE_CACHE_PUBLIC_URL = os.getenv("IMAGE_CACHE_PUBLIC_URL", "").rstrip("/") # Optional static host serving IMAGE_CACHE_DIR/objects
+IMAGE_MAX_SIZE = int(os.getenv("IMAGE_MAX_SIZE", "512")) # Longest side in pixels after resizing
+IMAGE_MAX_DOWNLOAD_BYTES = int(os.getenv("IMAGE_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = aiohttp.ClientTimeout(total=float(os.getenv("IMAGE_FETCH_TIMEOUT", "20")))
+IMAGE_PREFETCH_CONCURRENCY = int(os.getenv("IMAGE_PREFETCH_CONCURRENCY", "8"))
+
+CONTENT_TYPE_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/gif": "gif", "image/webp": "webp"}
+
+class ImageTooLarge(Exception):
+    pass
+
+class ImageCache:
+    """
+    Content-addressed on-disk image store with LRU eviction (object mtime is the recency stamp).
+    """
+    def __init__(self, directory: str, max_bytes: int, max_size: int):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.refs_dir = os.path.join(directory, "refs")
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self._total_bytes = None # Scanned lazily on first write
+        self._lock = threading.Lock() # Writes run in worker threads
+        self._inflight = {} # url -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.failed = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _ref_path(self, url: str):
+        return os.path.join(self.refs_dir, hashlib.sha1(url.encode()).hexdigest())
+
+    def _resolve(self, url: str, touch: bool):
+        """
+        Blocking; run in a worker thread. Drops the ref if its object has been evicted.
+        """
+        ref_path = self._ref_path(url)
+        try:
+            with open(ref_path) as ref:
+                name = ref.read().strip()
+        except OSError:
+            return None
+        try:
+            if touch:
+                os.utime(self.path(name))
+            elif not os.path.exists(self.path(name)):
+                raise FileNotFoundError(name)
+        except OSError:
+            self._drop_dangling_ref(ref_path, name)
+            return None
+        return name
+
+    def _drop_dangling_ref(self, ref_path: str, name: str):
+        with self._lock:
+            # _store may have repointed the ref meanwhile; only remove it if it still names the missing object
+            try:
+                with open(ref_path) as ref:
+                    if ref.read().strip() != name or os.path.exists(self.path(name)):
+                        return
+                os.remove(ref_path)
+            except OSError:
+                pass
+
+    async def lookup(self, url: str):
+        """
+        Returns the cached object's file name for a source URL, or None. Marks it as recently used.
+        The ref read and mtime touch run in a worker thread, off the event loop.
+        """
+        if not self.enabled or not url:
+            return None
+        name = await asyncio.to_thread(self._resolve, url, True)
+        if name:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return name
+
+    def path(self, name: str):
+        return os.path.join(self.objects_dir, name)
+
+    def public_url(self, name: str):
+        return f"{IMAGE_CACHE_PUBLIC_URL}/{name}" if IMAGE_CACHE_PUBLIC_URL else None
+
+    def _encode(self, data: bytes, content_type: str):
+        """
+        Resizes to fit max_size and re-encodes as WebP. Falls back to the original bytes without Pillow.
+        """
+        if Image is None:
+            return data, CONTENT_TYPE_EXTENSIONS.get(content_type, "png")
+        with Image.open(io.BytesIO(data)) as image:
+            image.seek(0) # First frame of animations
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+            image.thumbnail((self.max_size, self.max_size))
+            output = io.BytesIO()
+            image.save(output, format="WEBP", quality=85)
+        return output.getvalue(), "webp"
+
+    def _scan(self):
+        total = 0
+        for entry in os.scandir(self.objects_dir):
+            if entry.is_file():
+                total += entry.stat().st_size
+        return total
+
+    def _store(self, url: str, data: bytes, content_type: str):
+        body, extension = self._encode(data, content_type)
+        name = f"{hashlib.sha256(body).hexdigest()}.{extension}"
+        object_path = self.path(name)
+
+        with self._lock:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            os.makedirs(self.refs_dir, exist_ok=True)
+            if self._total_bytes is None:
+                self._total_bytes = self._scan()
+
+            if os.path.exists(object_path):
+                os.utime(object_path) # Same artwork behind another URL
+            else:
+                temp_path = f"{object_path}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(body)
+                os.replace(temp_path, object_path)
+                self._total_bytes += len(body)
+
+            temp_ref = f"{self._ref_path(url)}.tmp"
+            with open(temp_ref, "w") as ref:
+                ref.write(name)
+            os.replace(temp_ref, self._ref_path(url))
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return name
+
+    def _evict(self):
+        """
+        Deletes least recently used objects until the cache is under 90% of max_bytes, then the
+        refs pointing at them. Refs (a few bytes each) are not counted towards max_bytes.
+        """
+        entries = sorted(
+            (entry for entry in os.scandir(self.objects_dir) if entry.is_file() and not entry.name.endswith(".tmp")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        self._total_bytes = sum(entry.stat().st_size for entry in entries)
+        target = self.max_bytes * 0.9
+        deleted = set()
+        for entry in entries:
+            if self._total_bytes <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._total_bytes -= size
+            self.evicted += 1
+            deleted.add(entry.name)
+
+        if deleted:
+            for entry in os.scandir(self.refs_dir):
+                try:
+                    with open(entry.path) as ref:
+                        if ref.read().strip() in deleted:
+                            os.remove(entry.path)
+                except OSError:
+                    continue
+
+    async def _download(self, url: str):
+        async with get_http_session().get(url, timeout=IMAGE_FETCH_TIMEOUT) as response:
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status)
+            if response.content_length and response.content_length > IMAGE_MAX_DOWNLOAD_BYTES:
+                raise ImageTooLarge(f"{response.content_length} bytes")
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                data.extend(chunk)
+                if len(data) > IMAGE_MAX_DOWNLOAD_BYTES:
+                    raise ImageTooLarge(f"over {IMAGE_MAX_DOWNLOAD_BYTES} bytes")
+            return bytes(data), response.content_type
+
+    async def _fetch(self, url: str):
+        try:
+            data, content_type = await self._download(url)
+            # Decoding/resizing and file writes are blocking; keep them off the event loop
+            name = await asyncio.to_thread(self._store, url, data, content_type)
+        except Exception as e:
+            self.failed += 1
+            print(f"Image fetch failed for {url}: {e}")
+            return None
+        self.fetched += 1
+        return name
+
+    async def fetch(self, url: str):
+        """
+        Downloads and caches an image unless it is cached already. Returns the object name or None.
+        Concurrent requests for the same URL share one download.
+        """
+        if not self.enabled or not url:
+            return None
+        name = await self.lookup(url)
+        if name:
+            return name
+        return await asyncio.shield(self._start_fetch(url))
+
+    def _start_fetch(self, url: str):
+        task = self._inflight.get(url)
+        if task is None:
+            task = self._inflight[url] = asyncio.ensure_future(self._fetch(url))
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return task
+
+    def fetch_in_background(self, url: str):
+        """
+        Starts caching an image without waiting for it (e.g. after a /flex cache miss).
+        """
+        if self.enabled and url:
+            self._start_fetch(url)
+
+    async def prefetch(self, urls, concurrency: int = IMAGE_PREFETCH_CONCURRENCY):
+        """
+        Caches every URL not cached yet with at most `concurrency` downloads in flight.
+        Returns {"cached": n, "fetched": n, "failed": n}.
+        """
+        stats = {"cached": 0, "fetched": 0, "failed": 0}
+        if not self.enabled:
+            return stats
+        pending = iter(dict.fromkeys(url for url in urls if url))
+
+        # A fixed pool of workers, so a 100k-item collection doesn't create 100k tasks up front
+        async def worker():
+            for url in pending:
+                if await asyncio.to_thread(self._resolve, url, False):
+                    stats["cached"] += 1
+                    continue
+                stats["fetched" if await self.fetch(url) else "failed"] += 1
+
+        await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+        return stats
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "resizing": Image is not None,
+            "bytes": self._total_bytes if self._total_bytes is not None else "not scanned",
+            "max_bytes": self.max_bytes,
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetched": self.fetched,
+            "failed": self.failed,
+            "evicted": self.evicted,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+image_cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_MAX_SIZE)
+Gauge("flexbot_image_cache_hit_ratio", "Image cache hits per lookup", callback=lambda: image_cache.stats()["hit_rate"])
+Gauge("flexbot_image_cache_bytes", "Bytes stored in the image cache", callback=lambda: image_cache.stats()["bytes"])
+
+_prefetch_tasks = {} # collection_slug -> asyncio.Task
+
+async def prefetch_collection_images(collection_slug: str):
+    """
+    Caches artwork for every NFT stored for a collection.
+    """
+    urls = await repository.get_collection_image_urls(collection_slug)
+    stats = await image_cache.prefetch(urls)
+    print(f"Image prefetch for {collection_slug}: {stats['fetched']} fetched, {stats['cached']} already cached, {stats['failed']} failed.")
+    return stats
+
+def schedule_collection_prefetch(collection_slug: str):
+    """
+    Starts prefetch_collection_images in the background unless one is already running for the collection.
+    """
+    if not image_cache.enabled:
+        return None
+    task = _prefetch_tasks.get(collection_slug)
+    if task is None or task.done():
+        task = _prefetch_tasks[collection_slug] = asyncio.create_task(prefetch_collection_images(collection_slug))
+    return task
@@ -0,0 +1,221 @@
+import asyncio
+import os
+import time
+from aiohttp import web
+from dotenv import load_dotenv
+
+# In-process metrics exposed in the Prometheus text format on a local HTTP endpoint.
+# Modules create their histograms/counters here and gauges read live values through callbacks,
+# so scraping never touches Discord, the RPC or the database.
+
+# Imported ahead of shared.database's load_dotenv(), so load .env here before reading the settings
+load_dotenv()
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108")) # 0 disables the endpoint
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5")) # Seconds between event-loop lag probes
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_metrics = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} # label values tuple -> metric state
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    """
+    Gauge set explicitly, or computed at scrape time by `callback` (returning a number, or
+    {label values tuple: number} when the gauge has labels).
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def _render_samples(self):
+        values = self._values
+        if self.callback is not None:
+            try:
+                result = self.callback()
+            except Exception:
+                return []
+            values = result if isinstance(result, dict) else {(): result}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values.items() if isinstance(value, (int, float))
+        ]
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = dict(self.labels)
+        if "status" in self.histogram.labelnames:
+            labels["status"] = "error" if exc_type else "ok"
+        self.histogram.observe(time.perf_counter() - self.start, **labels)
+        return False
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def time(self, **labels):
+        """
+        Context manager observing the block's duration; fills a "status" label with ok/error if present.
+        """
+        return _Timer(self, labels)
+
+    def _render_samples(self):
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Shared metrics ---
+
+COMMAND_SECONDS = Histogram("flexbot_command_duration_seconds", "App command handling time", ("command", "status"))
+COMMAND_ERRORS = Counter("flexbot_command_errors_total", "App command errors (raised or reported to the user)", ("command",))
+AUTOCOMPLETE_SECONDS = Histogram("flexbot_autocomplete_duration_seconds", "Autocomplete handling time", ("option",))
+RPC_SECONDS = Histogram("flexbot_rpc_duration_seconds", "Solana RPC request time", ("method", "status"))
+HOWRARE_SECONDS = Histogram("flexbot_howrare_fetch_duration_seconds", "HowRare collection download time (streaming: until response headers)", ("mode", "status"))
+DB_SECONDS = Histogram("flexbot_db_query_duration_seconds", "Repository call time including executor queueing", ("query", "status"))
+SYNC_ITEMS = Counter("flexbot_sync_items_total", "HowRare items processed by collection syncs", ("collection",))
+SYNC_ITEMS_PER_SECOND = Gauge("flexbot_sync_items_per_second", "Throughput of the last collection sync", ("collection",))
+LOOP_LAG_SECONDS = Histogram(
+    "flexbot_event_loop_lag_seconds", "Delay of a scheduled wake-up on the event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+def observe_interaction_start(interaction):
+    interaction.extras["metrics_started"] = time.perf_counter()
+
+def mark_command_failed(interaction):
+    """
+    Records that a command failed even though its handler caught the error and replied, so it is
+    counted in COMMAND_ERRORS and observed with status="error" when it completes.
+    """
+    interaction.extras["failed"] = True
+
+def observe_interaction_end(interaction, command_name: str, failed: bool):
+    failed = failed or interaction.extras.get("failed", False)
+    started = interaction.extras.get("metrics_started")
+    if started is not None:
+        COMMAND_SECONDS.observe(time.perf_counter() - started, command=command_name, status="error" if failed else "ok")
+    if failed:
+        COMMAND_ERRORS.inc(command=command_name)
+
+# --- Endpoint ---
+
+_runner = None
+_lag_task = None
+
+async def _monitor_loop_lag(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(loop.time() - expected, 0.0))
+
+async def _handle_metrics(request):
+    return web.Response(body=render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """
+    Serves GET /metrics and starts the event-loop lag probe. Called from CoreFlexbot.setup_hook.
+    """
+    global _runner, _lag_task
+    if port <= 0 or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    _runner = runner
+    _lag_task = asyncio.create_task(_monitor_loop_lag(LOOP_LAG_INTERVAL))
+    print(f"Metrics available at http://{host}:{port}/metrics")
+
+async def stop_metrics_server():
+    global _runner, _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,93 @@
+import heapq
+import os
+import time
+from shared import repository
+from shared.ownership_writer import ownership_writer
+from shared.guild_config import get_configured_collections
+from shared.solana_utils import get_assets_for_wallets, get_collection_address
+
+# Background ownership refresh.
+# /flex answers from FlexNFT.owner_wallet while a wallet's last refresh is younger than
+# OWNERSHIP_MAX_STALENESS; the refresher cog keeps linked wallets inside that bound, taking
+# recently active wallets first and filling the rest of each batch with the stalest ones.
+
+OWNERSHIP_MAX_STALENESS = float(os.getenv("OWNERSHIP_MAX_STALENESS", "300"))
+OWNERSHIP_REFRESH_INTERVAL = float(os.getenv("OWNERSHIP_REFRESH_INTERVAL", "30")) # 0 disables the refresher
+OWNERSHIP_REFRESH_BATCH = int(os.getenv("OWNERSHIP_REFRESH_BATCH", "100")) # Wallets per refresh cycle
+
+class RefreshQueue:
+    """
+    (wallet, collection) pairs waiting for a refresh, most recently active first.
+    Marking a pair again moves it to the front; superseded heap entries are skipped when popped.
+    """
+    def __init__(self):
+        self._heap = [] # (-last_active, (wallet, collection_slug))
+        self._active = {} # (wallet, collection_slug) -> last_active
+
+    def __len__(self):
+        return len(self._active)
+
+    def mark_active(self, wallet_address: str, collection_slug: str):
+        key = (wallet_address, collection_slug)
+        now = time.monotonic()
+        self._active[key] = now
+        heapq.heappush(self._heap, (-now, key))
+        if len(self._heap) > 2 * len(self._active) + 64:
+            # Drop superseded entries so a few very active users can't grow the heap unbounded
+            self._heap = [(-last_active, key) for key, last_active in self._active.items()]
+            heapq.heapify(self._heap)
+
+    def pop_batch(self, limit: int):
+        batch = []
+        while self._heap and len(batch) < limit:
+            neg_last_active, key = heapq.heappop(self._heap)
+            if self._active.get(key) != -neg_last_active:
+                continue
+            del self._active[key]
+            batch.append(key)
+        return batch
+
+refresh_queue = RefreshQueue()
+
+async def refresh_wallets(pairs):
+    """
+    Refreshes ownership for [(wallet, collection_slug)] with batched DAS lookups per collection.
+    Wallets whose lookup fails keep their previous refresh time and are retried by a later sweep.
+    Returns {"refreshed": n, "failed": n}.
+    """
+    by_collection = {}
+    for wallet_address, collection_slug in pairs:
+        by_collection.setdefault(collection_slug, []).append(wallet_address)
+
+    stats = {"refreshed": 0, "failed": 0}
+    for collection_slug, wallets in by_collection.items():
+        results = await get_assets_for_wallets(wallets, get_collection_address(collection_slug))
+        for wallet_address, result in results.items():
+            if result["error"]:
+                stats["failed"] += 1
+                continue
+            asset_map = {asset['mint']: asset for asset in result["assets"]}
+            await ownership_writer.reconcile(wallet_address, collection_slug, asset_map, record_refresh=True)
+            stats["refreshed"] += 1
+    return stats
+
+async def run_refresh_cycle(batch_size: int = OWNERSHIP_REFRESH_BATCH):
+    """
+    One refresher pass: recently active wallets first, then wallets that would go stale before
+    the next pass, across every configured collection.
+    """
+    pairs = refresh_queue.pop_batch(batch_size)
+    queued = set(pairs)
+    sweep_age = max(OWNERSHIP_MAX_STALENESS - OWNERSHIP_REFRESH_INTERVAL, 0)
+
+    for collection_slug in sorted(get_configured_collections()):
+        remaining = batch_size - len(pairs)
+        if remaining <= 0:
+            break
+        for wallet_address in await repository.get_stale_wallets(collection_slug, sweep_age, remaining):
+            if (wallet_address, collection_slug) not in queued:
+                pairs.append((wallet_address, collection_slug))
+
+    if not pairs:
+        return {"refreshed": 0, "failed": 0}
+    return await refresh_wallets(pairs)
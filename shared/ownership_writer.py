@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from shared import repository
+from shared.rarity_config import get_tier_name
+from shared.trait_index import trait_index_cache
+from shared.metrics import Gauge
+
+# Write-behind buffer for ownership reconciliation.
+# Live DAS results are diffed against the stored rows (plus anything already queued) and only real
+# changes are queued; a background task flushes them every OWNERSHIP_FLUSH_INTERVAL seconds as a
+# handful of batched statements in one transaction, so concurrent /flex calls don't each open a
+# write transaction and lock the same rows.
+
+OWNERSHIP_FLUSH_INTERVAL = float(os.getenv("OWNERSHIP_FLUSH_INTERVAL", "2"))
+OWNERSHIP_FLUSH_MAX_PENDING = int(os.getenv("OWNERSHIP_FLUSH_MAX_PENDING", "5000")) # Flush early past this many queued rows
+
+class OwnershipWriter:
+    """
+    Queues ownership, attribute and image changes per mint; later changes to a mint replace earlier ones.
+    Callers get results reflecting their live data immediately, before the flush.
+    """
+    def __init__(self, flush_interval: float, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._updates = {} # mint -> {column: value}
+        self._clears = {} # mint -> wallet that no longer holds it
+        self._refreshes = {} # (wallet, collection_slug) -> refreshed_at
+        self._dirty_wallets = set() # Trait indexes to drop once the flush lands
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.reconciles = 0
+        self.unchanged = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failed_flushes = 0
+
+    def pending(self):
+        return len(self._updates) + len(self._clears)
+
+    def _overlay(self, row):
+        """
+        Applies queued changes to a stored row so diffs are taken against the state the DB is headed to.
+        """
+        mint = row['mint']
+        if mint in self._clears:
+            row['owner_wallet'] = None
+        fields = self._updates.get(mint)
+        if fields:
+            row.update({'image' if key == 'image_url' else key: value for key, value in fields.items()})
+        return row
+
+    def _queue_update(self, mint, fields):
+        self._updates.setdefault(mint, {}).update(fields)
+        if 'owner_wallet' in fields:
+            self._clears.pop(mint, None)
+
+    def _queue_clear(self, mint, wallet_address):
+        fields = self._updates.get(mint)
+        if fields:
+            fields.pop('owner_wallet', None)
+            if not fields:
+                del self._updates[mint]
+        self._clears[mint] = wallet_address
+
+    async def reconcile(self, wallet_address: str, collection_slug: str, asset_map: dict, record_refresh: bool = True):
+        """
+        Diffs live assets ({mint: asset}) for a wallet against stored rows and queues the differences.
+        With record_refresh, also queues the wallet's refresh stamp. Returns the wallet's NFTs as dicts.
+        """
+        stored = await repository.get_ownership_state(wallet_address, collection_slug, list(asset_map))
+        self.reconciles += 1
+        changed = False
+        results = []
+
+        for mint, row in stored.items():
+            row = self._overlay(row)
+            live_asset = asset_map.get(mint)
+            if live_asset is None:
+                # Stored as the wallet's but missing from the live list
+                if row['owner_wallet'] == wallet_address:
+                    self._queue_clear(mint, wallet_address)
+                    changed = True
+                continue
+
+            fields = {}
+            if row['owner_wallet'] != wallet_address:
+                fields['owner_wallet'] = wallet_address
+                if row['owner_wallet']:
+                    # The previous holder's trait index still lists this NFT
+                    self._dirty_wallets.add(row['owner_wallet'])
+            # Live RPC attributes win over the synced ones (fixes "Stale Traits")
+            if live_asset.get('attributes') and live_asset['attributes'] != row['attributes']:
+                fields['attributes'] = live_asset['attributes']
+                fields['tier'] = get_tier_name(row['rank'], live_asset['attributes'], collection_slug)
+            if live_asset.get('image') and live_asset['image'] != row['image']:
+                fields['image_url'] = live_asset['image']
+
+            if fields:
+                self._queue_update(mint, fields)
+                row = self._overlay(row)
+                changed = True
+            row.pop('owner_wallet')
+            results.append(row)
+
+        if changed:
+            self._dirty_wallets.add(wallet_address)
+        else:
+            self.unchanged += 1
+        if record_refresh:
+            self._refreshes[(wallet_address, collection_slug)] = time.time()
+
+        if self.pending() >= self.max_pending:
+            await self.flush()
+        return results
+
+    async def current_nfts(self, wallet_address: str, collection_slug: str):
+        """
+        The wallet's stored NFTs with queued changes applied, for when live data is unavailable.
+        """
+        incoming = [mint for mint, fields in self._updates.items() if fields.get('owner_wallet') == wallet_address]
+        stored = await repository.get_ownership_state(wallet_address, collection_slug, incoming)
+        results = []
+        for row in stored.values():
+            row = self._overlay(row)
+            if row.pop('owner_wallet') == wallet_address:
+                results.append(row)
+        return results
+
+    async def flush(self):
+        """
+        Writes everything queued so far. On failure the changes are requeued (newer ones win).
+        """
+        async with self._flush_lock:
+            if not (self._updates or self._clears or self._refreshes):
+                return
+            updates, clears, refreshes, dirty = self._updates, self._clears, self._refreshes, self._dirty_wallets
+            self._updates, self._clears, self._refreshes, self._dirty_wallets = {}, {}, {}, set()
+
+            try:
+                await repository.apply_ownership_changes(updates, clears, refreshes)
+            except Exception as e:
+                print(f"Ownership flush failed, will retry: {e}")
+                self.failed_flushes += 1
+                for mint, fields in updates.items():
+                    if mint not in self._clears:
+                        self._updates[mint] = {**fields, **self._updates.get(mint, {})}
+                for mint, wallet_address in clears.items():
+                    if mint not in self._updates and mint not in self._clears:
+                        self._clears[mint] = wallet_address
+                for key, refreshed_at in refreshes.items():
+                    self._refreshes.setdefault(key, refreshed_at)
+                self._dirty_wallets |= dirty
+                return
+
+            self.flushes += 1
+            self.rows_written += len(updates) + len(clears)
+            # Trait counts come from the DB, so drop cached indexes only once the rows are there
+            for wallet_address in dirty:
+                trait_index_cache.invalidate_wallet(wallet_address)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the periodic flush and writes whatever is still queued.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "pending_refreshes": len(self._refreshes),
+            "reconciles": self.reconciles,
+            "unchanged": self.unchanged,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failed_flushes": self.failed_flushes,
+        }
+
+ownership_writer = OwnershipWriter(OWNERSHIP_FLUSH_INTERVAL, OWNERSHIP_FLUSH_MAX_PENDING)
+Gauge("flexbot_ownership_writes_pending", "Ownership changes waiting for the next flush", callback=ownership_writer.pending)
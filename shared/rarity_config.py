@@ -1,3 +1,5 @@
+import bisect
+
 RARITY_CONFIGS = {
     "the_growerz": {
         "tiers": [
@@ -55,3 +57,73 @@ RARITY_CONFIGS = {
         "special_attributes": []
     }
 }
+
+
+# Compiled lookup tables, built once at import.
+# Ranks resolve to a tier with a bisect over the sorted max_rank bounds, and special traits are a
+# dict keyed by (trait_type, lowercased value), so get_rarity_info does no nested scanning.
+
+DEFAULT_RARITY = ("Ranked", 0x808080) # Grey, for collections without a config
+FALLBACK_TIER = ("Common", 0xADFF2F)
+
+def _compile_config(config: dict):
+    tiers = sorted(config.get("tiers", []), key=lambda tier: tier["max_rank"])
+    special = {}
+    for priority, attr in enumerate(config.get("special_attributes", [])):
+        key = (attr["trait_type"], str(attr["value"]).lower())
+        special.setdefault(key, (priority, attr["name"], attr["color"]))
+    return {
+        "max_ranks": [tier["max_rank"] for tier in tiers],
+        "tiers": [(tier["name"], tier["color"]) for tier in tiers],
+        "special": special,
+    }
+
+COMPILED_RARITY = {slug: _compile_config(config) for slug, config in RARITY_CONFIGS.items()}
+
+def get_rarity_info(rank: int, attributes: list, collection_slug: str):
+    """
+    Determines the rarity name and color for a given rank and attributes based on the collection configuration.
+    """
+    compiled = COMPILED_RARITY.get(collection_slug)
+
+    # Default fallback if config doesn't exist
+    if not compiled:
+        return DEFAULT_RARITY
+
+    # 1. Check Special Attributes (HowRare uses "name", DAS metadata uses "trait_type")
+    if compiled["special"]:
+        best = None
+        for attr in attributes or []:
+            key = (attr.get('name') or attr.get('trait_type'), str(attr.get('value')).lower())
+            match = compiled["special"].get(key)
+            if match and (best is None or match[0] < best[0]):
+                best = match
+        if best:
+            return best[1], best[2]
+
+    # 2. Check Rank Tiers
+    if rank is None:
+        return FALLBACK_TIER
+    index = bisect.bisect_left(compiled["max_ranks"], rank)
+    if index < len(compiled["tiers"]):
+        return compiled["tiers"][index]
+    return FALLBACK_TIER
+
+def get_tier_name(rank: int, attributes: list, collection_slug: str):
+    """
+    Tier name to persist on FlexNFT, or None for collections without a rarity config.
+    """
+    if collection_slug not in COMPILED_RARITY:
+        return None
+    return get_rarity_info(rank, attributes, collection_slug)[0]
+
+def get_tier_names(collection_slug: str):
+    """
+    Tier names for a collection, best first (special traits, then rank tiers).
+    """
+    compiled = COMPILED_RARITY.get(collection_slug)
+    if not compiled:
+        return []
+    names = [name for _, name, _ in sorted(compiled["special"].values())]
+    names += [name for name, _ in compiled["tiers"]]
+    return list(dict.fromkeys(names))
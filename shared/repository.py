@@ -0,0 +1,496 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, or_, update
+from shared.metrics import DB_SECONDS
+from shared.database import dialect_insert, get_session, refresh_holder_stats, replace_traits, FlexPlayer, FlexNFT, FlexNFTTrait, FlexGuildConfig, FlexWalletRefresh, FlexHolderStats, FlexRoleRule, FlexBotState, DB_POOL_SIZE
+
+# Awaitable data-access layer for the cogs.
+# SQLAlchemy calls are blocking, so each public coroutine below runs its query in a
+# bounded thread pool and hands back plain Python values (never live ORM objects),
+# keeping the discord.py event loop free while Postgres does the work.
+
+# One worker per pooled connection; more threads would only queue on the pool.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE)))
+
+# How long autocomplete may reuse a user's linked wallet without asking the DB.
+# Kept short because other bot containers sharing the database can relink wallets.
+WALLET_LOOKUP_TTL = float(os.getenv("WALLET_LOOKUP_TTL", "60"))
+
+_wallet_lookup_cache = {} # discord_id -> (expires_at, wallet_address)
+
+_executor = None
+
+def get_db_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="flex-db")
+    return _executor
+
+def shutdown_db_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+async def run_db(func, *args, **kwargs):
+    """
+    Runs a blocking database function in the DB executor and awaits its result.
+    """
+    loop = asyncio.get_running_loop()
+    with DB_SECONDS.time(query=func.__name__.lstrip("_")):
+        return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+def _nft_to_dict(nft):
+    return {
+        'name': nft.name,
+        'rank': nft.rank,
+        'image': nft.image_url,
+        'attributes': nft.attributes,
+        'mint': nft.mint,
+        'tier': nft.tier
+    }
+
+# --- Players ---
+
+def _get_wallet(discord_id):
+    session = get_session()
+    try:
+        player = session.query(FlexPlayer).filter_by(discord_id=discord_id).first()
+        return player.wallet_address if player else None
+    finally:
+        session.close()
+
+def _set_wallet(discord_id, address):
+    session = get_session()
+    try:
+        player = session.query(FlexPlayer).filter_by(discord_id=discord_id).first()
+        previous = player.wallet_address if player else None
+        if not player and address is None:
+            return None
+        if not player:
+            player = FlexPlayer(discord_id=discord_id)
+            session.add(player)
+
+        player.wallet_address = address
+        session.commit()
+        return previous
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+async def get_wallet(discord_id: int):
+    """
+    Returns the wallet address linked to a Discord user, or None.
+    """
+    return await run_db(_get_wallet, discord_id)
+
+async def get_wallet_cached(discord_id: int):
+    """
+    get_wallet() with a short in-process TTL, for hot paths such as autocomplete.
+    """
+    entry = _wallet_lookup_cache.get(discord_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    wallet_address = await get_wallet(discord_id)
+    _wallet_lookup_cache[discord_id] = (time.monotonic() + WALLET_LOOKUP_TTL, wallet_address)
+    return wallet_address
+
+async def set_wallet(discord_id: int, address):
+    """
+    Links (or with address=None, unlinks) a wallet for a Discord user.
+    Returns the previously linked address, if any.
+    """
+    previous = await run_db(_set_wallet, discord_id, address)
+    _wallet_lookup_cache.pop(discord_id, None)
+    return previous
+
+# --- Guild Config ---
+
+def _get_guild_collection(guild_id):
+    session = get_session()
+    try:
+        config = session.query(FlexGuildConfig).filter_by(guild_id=guild_id).first()
+        return config.collection_slug if config else None
+    finally:
+        session.close()
+
+def _set_guild_collection(guild_id, collection_slug):
+    session = get_session()
+    try:
+        config = session.query(FlexGuildConfig).filter_by(guild_id=guild_id).first()
+        if not config:
+            config = FlexGuildConfig(guild_id=guild_id, collection_slug=collection_slug)
+            session.add(config)
+        else:
+            config.collection_slug = collection_slug
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _get_all_guild_collections():
+    session = get_session()
+    try:
+        return dict(session.query(FlexGuildConfig.guild_id, FlexGuildConfig.collection_slug).all())
+    finally:
+        session.close()
+
+async def get_all_guild_collections():
+    """
+    Returns {guild_id: collection_slug} for every configured guild.
+    """
+    return await run_db(_get_all_guild_collections)
+
+async def get_guild_collection(guild_id: int):
+    return await run_db(_get_guild_collection, guild_id)
+
+async def set_guild_collection(guild_id: int, collection_slug: str):
+    await run_db(_set_guild_collection, guild_id, collection_slug)
+
+# --- Bot State ---
+
+def _get_bot_state(key):
+    session = get_session()
+    try:
+        state = session.get(FlexBotState, key)
+        return state.value if state else None
+    finally:
+        session.close()
+
+def _set_bot_state(key, value):
+    session = get_session()
+    try:
+        session.merge(FlexBotState(key=key, value=value, updated_at=time.time()))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+async def get_bot_state(key: str):
+    """
+    Returns a stored bot state value, or None.
+    """
+    return await run_db(_get_bot_state, key)
+
+async def set_bot_state(key: str, value: str):
+    await run_db(_set_bot_state, key, value)
+
+# --- Role Rules ---
+
+def _role_rule_to_dict(rule):
+    return {'role_id': rule.role_id, 'min_count': rule.min_count, 'tier': rule.tier}
+
+def _get_role_rules(guild_id):
+    session = get_session()
+    try:
+        rules = session.query(FlexRoleRule).filter_by(guild_id=guild_id).order_by(FlexRoleRule.id).all()
+        return [_role_rule_to_dict(rule) for rule in rules]
+    finally:
+        session.close()
+
+def _set_role_rule(guild_id, role_id, min_count, tier):
+    session = get_session()
+    try:
+        rule = session.query(FlexRoleRule).filter_by(guild_id=guild_id, role_id=role_id).first()
+        if not rule:
+            rule = FlexRoleRule(guild_id=guild_id, role_id=role_id)
+            session.add(rule)
+        rule.min_count = min_count
+        rule.tier = tier
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _remove_role_rule(guild_id, role_id):
+    session = get_session()
+    try:
+        removed = session.query(FlexRoleRule).filter_by(guild_id=guild_id, role_id=role_id).delete()
+        session.commit()
+        return removed > 0
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+async def get_role_rules(guild_id: int):
+    """
+    Returns the guild's holder role rules as [{role_id, min_count, tier}].
+    """
+    return await run_db(_get_role_rules, guild_id)
+
+async def set_role_rule(guild_id: int, role_id: int, min_count: int = 1, tier: str = None):
+    """
+    Creates or replaces the rule for a role.
+    """
+    await run_db(_set_role_rule, guild_id, role_id, min_count, tier)
+
+async def remove_role_rule(guild_id: int, role_id: int):
+    """
+    Deletes the rule for a role. Returns False if there was none.
+    """
+    return await run_db(_remove_role_rule, guild_id, role_id)
+
+# --- NFTs ---
+
+def _count_collection_nfts(collection_slug):
+    session = get_session()
+    try:
+        return session.query(FlexNFT).filter_by(collection_slug=collection_slug).count()
+    finally:
+        session.close()
+
+def _get_wallet_trait_counts(wallet_address, collection_slug):
+    session = get_session()
+    try:
+        rows = session.query(FlexNFTTrait.trait_type, FlexNFTTrait.value, func.count()).join(
+            FlexNFT, FlexNFT.mint == FlexNFTTrait.mint
+        ).filter(
+            FlexNFT.owner_wallet == wallet_address,
+            FlexNFT.collection_slug == collection_slug
+        ).group_by(FlexNFTTrait.trait_type, FlexNFTTrait.value).all()
+        return [(trait_type, value, count) for trait_type, value, count in rows]
+    finally:
+        session.close()
+
+def _get_wallet_tier_counts(wallet_address, collection_slug):
+    session = get_session()
+    try:
+        rows = session.query(FlexNFT.tier, func.count()).filter(
+            FlexNFT.owner_wallet == wallet_address,
+            FlexNFT.collection_slug == collection_slug,
+            FlexNFT.tier.isnot(None)
+        ).group_by(FlexNFT.tier).all()
+        return dict(rows)
+    finally:
+        session.close()
+
+def _get_ownership_state(wallet_address, collection_slug, mints):
+    session = get_session()
+    try:
+        rows = session.query(FlexNFT).filter(
+            FlexNFT.collection_slug == collection_slug,
+            or_(FlexNFT.owner_wallet == wallet_address, FlexNFT.mint.in_(mints))
+        ).all()
+        return {nft.mint: {**_nft_to_dict(nft), 'owner_wallet': nft.owner_wallet} for nft in rows}
+    finally:
+        session.close()
+
+def _apply_ownership_changes(updates, clears, refreshes):
+    session = get_session()
+    try:
+        # Holders whose leaderboard stats move: previous and new owners of every touched mint
+        touched = list({*updates.keys(), *clears.keys()})
+        holders = set()
+        for mint, collection_slug, owner_wallet in session.query(FlexNFT.mint, FlexNFT.collection_slug, FlexNFT.owner_wallet).filter(FlexNFT.mint.in_(touched)):
+            holders.add((collection_slug, owner_wallet))
+            if 'owner_wallet' in updates.get(mint, {}):
+                holders.add((collection_slug, updates[mint]['owner_wallet']))
+
+        # Owners that lost a mint; guarded so a newer owner written by another process is kept
+        lost_by_wallet = {}
+        for mint, wallet_address in clears.items():
+            lost_by_wallet.setdefault(wallet_address, []).append(mint)
+        for wallet_address, mints in lost_by_wallet.items():
+            session.query(FlexNFT).filter(
+                FlexNFT.mint.in_(mints), FlexNFT.owner_wallet == wallet_address
+            ).update({"owner_wallet": None}, synchronize_session=False)
+
+        # New owners: one UPDATE ... WHERE mint IN (...) per wallet
+        gained_by_wallet = {}
+        for mint, fields in updates.items():
+            if 'owner_wallet' in fields:
+                gained_by_wallet.setdefault(fields['owner_wallet'], []).append(mint)
+        for wallet_address, mints in gained_by_wallet.items():
+            session.query(FlexNFT).filter(FlexNFT.mint.in_(mints)).update(
+                {"owner_wallet": wallet_address}, synchronize_session=False
+            )
+
+        # Metadata changes: executemany UPDATE by primary key
+        metadata_rows = [
+            {'mint': mint, **{key: value for key, value in fields.items() if key != 'owner_wallet'}}
+            for mint, fields in updates.items() if fields.keys() - {'owner_wallet'}
+        ]
+        if metadata_rows:
+            session.execute(update(FlexNFT), metadata_rows)
+        replace_traits(session, {mint: fields['attributes'] for mint, fields in updates.items() if 'attributes' in fields})
+        refresh_holder_stats(session, holders)
+
+        if refreshes:
+            insert = dialect_insert(session)
+            stmt = insert(FlexWalletRefresh).values([
+                {'wallet_address': wallet_address, 'collection_slug': collection_slug, 'refreshed_at': refreshed_at}
+                for (wallet_address, collection_slug), refreshed_at in refreshes.items()
+            ])
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=["wallet_address", "collection_slug"],
+                set_={"refreshed_at": stmt.excluded.refreshed_at}
+            ))
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _get_fresh_wallet_nfts(wallet_address, collection_slug, max_age):
+    session = get_session()
+    try:
+        refreshed_at = session.query(FlexWalletRefresh.refreshed_at).filter_by(
+            wallet_address=wallet_address, collection_slug=collection_slug
+        ).scalar()
+        if refreshed_at is None or refreshed_at < time.time() - max_age:
+            return None
+
+        nfts = session.query(FlexNFT).filter(
+            FlexNFT.owner_wallet == wallet_address,
+            FlexNFT.collection_slug == collection_slug
+        ).all()
+        return [_nft_to_dict(nft) for nft in nfts]
+    finally:
+        session.close()
+
+def _get_stale_wallets(collection_slug, max_age, limit):
+    session = get_session()
+    try:
+        rows = session.query(FlexPlayer.wallet_address).outerjoin(
+            FlexWalletRefresh,
+            (FlexWalletRefresh.wallet_address == FlexPlayer.wallet_address)
+            & (FlexWalletRefresh.collection_slug == collection_slug)
+        ).filter(
+            FlexPlayer.wallet_address.isnot(None),
+            or_(FlexWalletRefresh.refreshed_at.is_(None), FlexWalletRefresh.refreshed_at < time.time() - max_age)
+        ).group_by(FlexPlayer.wallet_address).order_by(
+            # Never-refreshed wallets first, then the oldest
+            func.min(func.coalesce(FlexWalletRefresh.refreshed_at, 0))
+        ).limit(limit).all()
+        return [wallet_address for wallet_address, in rows]
+    finally:
+        session.close()
+
+def _get_collection_image_urls(collection_slug):
+    session = get_session()
+    try:
+        rows = session.query(FlexNFT.image_url).filter(
+            FlexNFT.collection_slug == collection_slug, FlexNFT.image_url.isnot(None)
+        ).distinct().all()
+        return [image_url for image_url, in rows]
+    finally:
+        session.close()
+
+def _get_holdings_by_discord_id(collection_slug):
+    session = get_session()
+    try:
+        rows = session.query(FlexPlayer.discord_id, FlexHolderStats.nft_count, FlexHolderStats.tier_counts).join(
+            FlexHolderStats, FlexHolderStats.owner_wallet == FlexPlayer.wallet_address
+        ).filter(FlexHolderStats.collection_slug == collection_slug).all()
+        return {
+            discord_id: {'nft_count': nft_count, 'tier_counts': tier_counts or {}}
+            for discord_id, nft_count, tier_counts in rows
+        }
+    finally:
+        session.close()
+
+def _get_leaderboard(collection_slug, sort_by, offset, limit):
+    session = get_session()
+    try:
+        query = session.query(FlexHolderStats).filter(FlexHolderStats.collection_slug == collection_slug)
+        if sort_by == "best_rank":
+            # Holders without a ranked NFT aren't listed, so they aren't counted either
+            query = query.filter(FlexHolderStats.best_rank.isnot(None))
+            order = (FlexHolderStats.best_rank, FlexHolderStats.nft_count.desc(), FlexHolderStats.owner_wallet)
+        else:
+            order = (FlexHolderStats.nft_count.desc(), FlexHolderStats.best_rank, FlexHolderStats.owner_wallet)
+        total = query.count()
+        rows = query.order_by(*order).offset(offset).limit(limit).all()
+
+        wallets = [row.owner_wallet for row in rows]
+        players = dict(session.query(FlexPlayer.wallet_address, FlexPlayer.discord_id).filter(FlexPlayer.wallet_address.in_(wallets))) if wallets else {}
+        return total, [
+            {
+                'wallet': row.owner_wallet,
+                'discord_id': players.get(row.owner_wallet),
+                'nft_count': row.nft_count,
+                'best_rank': row.best_rank,
+                'tier_counts': row.tier_counts or {},
+            }
+            for row in rows
+        ]
+    finally:
+        session.close()
+
+async def count_collection_nfts(collection_slug: str):
+    return await run_db(_count_collection_nfts, collection_slug)
+
+async def get_wallet_trait_counts(wallet_address: str, collection_slug: str):
+    """
+    Returns [(trait_type, value, count)] for a wallet's NFTs in a collection (indexed trait table).
+    """
+    return await run_db(_get_wallet_trait_counts, wallet_address, collection_slug)
+
+async def get_wallet_tier_counts(wallet_address: str, collection_slug: str):
+    """
+    Returns {tier: count} for a wallet's NFTs in a collection (indexed tier column).
+    """
+    return await run_db(_get_wallet_tier_counts, wallet_address, collection_slug)
+
+async def get_collection_image_urls(collection_slug: str):
+    """
+    Returns every distinct image URL stored for a collection (for the image prefetcher).
+    """
+    return await run_db(_get_collection_image_urls, collection_slug)
+
+async def get_holdings_by_discord_id(collection_slug: str):
+    """
+    Returns {discord_id: {nft_count, tier_counts}} for every linked holder of a collection,
+    read from the precomputed holder stats in one query.
+    """
+    return await run_db(_get_holdings_by_discord_id, collection_slug)
+
+async def get_leaderboard(collection_slug: str, sort_by: str = "count", offset: int = 0, limit: int = 10):
+    """
+    Returns (total_holders, rows) from the precomputed holder stats, ordered by NFT count or best rank.
+    Each row has wallet, discord_id (None if unlinked), nft_count, best_rank and tier_counts.
+    """
+    return await run_db(_get_leaderboard, collection_slug, sort_by, offset, limit)
+
+async def get_ownership_state(wallet_address: str, collection_slug: str, mints: list):
+    """
+    Returns {mint: nft dict + 'owner_wallet'} for the collection's NFTs that are either stored as
+    owned by the wallet or listed in `mints`. Read-only; used to diff live assets against the DB.
+    """
+    return await run_db(_get_ownership_state, wallet_address, collection_slug, mints)
+
+async def apply_ownership_changes(updates: dict, clears: dict, refreshes: dict):
+    """
+    Writes buffered ownership changes in one transaction with batched statements.
+    updates: {mint: {column: value}}; clears: {mint: wallet that no longer holds it};
+    refreshes: {(wallet, collection_slug): refreshed_at}.
+    """
+    await run_db(_apply_ownership_changes, updates, clears, refreshes)
+
+async def get_fresh_wallet_nfts(wallet_address: str, collection_slug: str, max_age: float):
+    """
+    Returns the wallet's stored NFTs if its ownership was refreshed within max_age seconds, else None.
+    """
+    return await run_db(_get_fresh_wallet_nfts, wallet_address, collection_slug, max_age)
+
+async def get_stale_wallets(collection_slug: str, max_age: float, limit: int):
+    """
+    Returns up to `limit` linked wallets whose ownership in a collection is older than max_age
+    seconds (or was never refreshed), least recently refreshed first.
+    """
+    return await run_db(_get_stale_wallets, collection_slug, max_age, limit)
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from collections import deque
+import discord
+from shared.solana_utils import RateLimiter
+
+# Holder role synchronization.
+# The desired roles of every member are computed in one pass from the precomputed holder stats;
+# only members whose managed roles differ are queued, and the queue is drained at a bounded rate
+# with one member edit per member. A stopped job keeps its remaining queue and can be resumed.
+
+ROLE_SYNC_RATE = float(os.getenv("ROLE_SYNC_RATE", "5")) # Member edits per second (0 = unpaced)
+ROLE_SYNC_REASON = "Flexbot holder role sync"
+
+def qualifies(rule: dict, holding: dict) -> bool:
+    if not holding:
+        return False
+    count = holding['tier_counts'].get(rule['tier'], 0) if rule['tier'] else holding['nft_count']
+    return count >= rule['min_count']
+
+def compute_role_changes(members, rules, holdings):
+    """
+    Diffs the managed roles each member has against the ones their holdings qualify for.
+    members: iterable of discord.Member; rules: [{role_id, min_count, tier}];
+    holdings: {discord_id: {nft_count, tier_counts}}.
+    Returns [(member_id, roles_to_add, roles_to_remove)] for members that need a change.
+    """
+    managed = {rule['role_id'] for rule in rules}
+    changes = []
+    for member in members:
+        if member.bot:
+            continue
+        holding = holdings.get(member.id)
+        desired = {rule['role_id'] for rule in rules if qualifies(rule, holding)}
+        current = {role.id for role in member.roles} & managed
+        if desired != current:
+            changes.append((member.id, desired - current, current - desired))
+    return changes
+
+class RoleSyncJob:
+    """
+    Work queue of pending member role changes for one guild, with progress and throughput counters.
+    """
+    def __init__(self, guild_id: int, rate: float = ROLE_SYNC_RATE):
+        self.guild_id = guild_id
+        self.pending = deque() # (member_id, roles_to_add, roles_to_remove)
+        self.limiter = RateLimiter(rate)
+        self.task = None
+        self.stop_requested = False
+        self.planned = 0
+        self.applied = 0
+        self.skipped = 0
+        self.failed = 0
+        self.elapsed = 0.0
+        self.last_error = None
+        self._run_started = None
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def plan(self, changes):
+        self.pending = deque(changes)
+        self.planned = len(changes)
+        self.applied = self.skipped = self.failed = 0
+        self.elapsed = 0.0
+        self.last_error = None
+
+    async def _apply(self, guild: discord.Guild, member_id: int, roles_to_add: set, roles_to_remove: set):
+        member = guild.get_member(member_id)
+        if member is None:
+            self.skipped += 1 # Left the guild since the plan was made
+            return
+
+        # Re-check against the member's current roles; someone may have changed them meanwhile
+        current = {role.id for role in member.roles}
+        roles_to_add = {role_id for role_id in roles_to_add if role_id not in current and guild.get_role(role_id)}
+        roles_to_remove = roles_to_remove & current
+        if not roles_to_add and not roles_to_remove:
+            self.skipped += 1
+            return
+
+        roles = [role for role in member.roles if not role.is_default() and role.id not in roles_to_remove]
+        roles.extend(guild.get_role(role_id) for role_id in roles_to_add)
+
+        await self.limiter.acquire()
+        # One PATCH per member; discord.py waits out 429s for the route itself
+        await member.edit(roles=roles, reason=ROLE_SYNC_REASON)
+        self.applied += 1
+
+    async def run(self, guild: discord.Guild, on_progress=None, progress_every: int = 50):
+        """
+        Drains the queue until it is empty or stop() is called. Unfinished work stays queued.
+        on_progress: optional coroutine function called with the job every `progress_every` members.
+        """
+        self.stop_requested = False
+        self._run_started = time.monotonic()
+        done = 0
+        try:
+            while self.pending and not self.stop_requested:
+                member_id, roles_to_add, roles_to_remove = self.pending[0]
+                try:
+                    await self._apply(guild, member_id, roles_to_add, roles_to_remove)
+                except discord.HTTPException as e:
+                    # Missing permissions or role hierarchy: record and move on
+                    self.failed += 1
+                    self.last_error = str(e)
+                self.pending.popleft()
+                done += 1
+                if on_progress and done % progress_every == 0:
+                    await on_progress(self)
+        finally:
+            self.elapsed += time.monotonic() - self._run_started
+            self._run_started = None
+
+    def start(self, guild: discord.Guild, on_progress=None, on_done=None):
+        async def runner():
+            await self.run(guild, on_progress)
+            if on_done:
+                await on_done(self)
+        self.task = asyncio.create_task(runner())
+        return self.task
+
+    def stop(self):
+        self.stop_requested = True
+
+    def stats(self):
+        processed = self.applied + self.skipped + self.failed
+        elapsed = self.elapsed + (time.monotonic() - self._run_started if self._run_started else 0.0)
+        return {
+            "planned": self.planned,
+            "applied": self.applied,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "remaining": len(self.pending),
+            "elapsed_s": elapsed,
+            "members_per_s": processed / elapsed if elapsed else 0.0,
+        }
+
+def format_role_sync_stats(stats: dict) -> str:
+    return (f"{stats['applied']} updated, {stats['skipped']} already correct/left, {stats['failed']} failed, "
+            f"{stats['remaining']} remaining of {stats['planned']} planned "
+            f"({stats['elapsed_s']:.1f}s, {stats['members_per_s']:.1f} members/s)")
+
+role_sync_jobs = {} # guild_id -> RoleSyncJob
+
+def get_role_sync_job(guild_id: int) -> RoleSyncJob:
+    job = role_sync_jobs.get(guild_id)
+    if job is None:
+        job = role_sync_jobs[guild_id] = RoleSyncJob(guild_id)
+    return job
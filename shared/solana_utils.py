@@ -1,70 +1,264 @@
+import asyncio
 import os
-import aiohttp
-import json
+import time
+from shared.http_client import RPC_TIMEOUT, get_http_session
+from shared.metrics import RPC_SECONDS
 
 # Use the provided QuickNode URL as default, but prefer env var
 DEFAULT_RPC = "https://sly-young-bird.solana-mainnet.quiknode.pro/d2728f877d595d91908dcb5bbc4f7ec68c491396/"
 SOLANA_RPC_URL = os.getenv("SOLANA_RPC_URL", DEFAULT_RPC)
 
-async def get_assets_by_owner(wallet_address: str):
+# DAS pagination
+DAS_PAGE_LIMIT = 1000 # Maximum page size allowed by the DAS API
+DAS_PAGE_CONCURRENCY = int(os.getenv("DAS_PAGE_CONCURRENCY", "3"))
+DAS_MAX_PAGES = int(os.getenv("DAS_MAX_PAGES", "50"))
+
+# Multi-wallet lookups
+DAS_BATCH_SIZE = int(os.getenv("DAS_BATCH_SIZE", "25")) # Wallets per JSON-RPC batch array
+DAS_BATCH_CONCURRENCY = int(os.getenv("DAS_BATCH_CONCURRENCY", "2")) # Batch requests in flight
+RPC_REQUESTS_PER_SECOND = float(os.getenv("RPC_REQUESTS_PER_SECOND", "20")) # 0 disables the limiter
+
+def _parse_collection_addresses(raw: str):
     """
-    Fetches assets (NFTs) owned by a wallet using the Metaplex DAS API (getAssetsByOwner).
-    Returns a list of asset dictionaries containing mint, name, image_uri, etc.
+    Parses "slug=address,slug2=address2" into a dict.
+    """
+    addresses = {}
+    for pair in raw.split(","):
+        if "=" not in pair:
+            continue
+        slug, address = pair.split("=", 1)
+        if slug.strip() and address.strip():
+            addresses[slug.strip()] = address.strip()
+    return addresses
+
+# On-chain collection (verified collection mint) per HowRare slug. When set, wallet lookups use
+# searchAssets with a collection grouping filter so only that collection's assets are returned.
+COLLECTION_ADDRESSES = _parse_collection_addresses(os.getenv("SOLANA_COLLECTION_ADDRESSES", ""))
+
+class RpcError(Exception):
+    pass
+
+class RateLimiter:
+    """
+    Spaces RPC calls so they never exceed `rate` calls per second on average.
+    A JSON-RPC batch costs one call per element, which is how providers meter them.
+    """
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, cost: int = 1):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            self._next_slot = start + cost / self.rate
+        delay = start - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+rpc_rate_limiter = RateLimiter(RPC_REQUESTS_PER_SECOND)
+
+def get_collection_address(collection_slug: str):
+    return COLLECTION_ADDRESSES.get(collection_slug)
+
+async def _rpc_call(method: str, params: dict):
+    """
+    Sends a single JSON-RPC request and returns its "result". Raises RpcError on failure.
     """
     headers = {"Content-Type": "application/json"}
     payload = {
         "jsonrpc": "2.0",
         "id": 1,
-        "method": "getAssetsByOwner",
-        "params": {
+        "method": method,
+        "params": params
+    }
+
+    await rpc_rate_limiter.acquire()
+    session = get_http_session()
+    with RPC_SECONDS.time(method=method):
+        async with session.post(SOLANA_RPC_URL, headers=headers, json=payload, timeout=RPC_TIMEOUT) as response:
+            if response.status != 200:
+                raise RpcError(f"RPC Error: {response.status}")
+
+            data = await response.json()
+            if "error" in data:
+                raise RpcError(f"RPC Error Body: {data['error']}")
+            return data.get("result", {})
+
+async def _rpc_batch_call(calls: list):
+    """
+    Sends [(method, params), ...] as one JSON-RPC batch array.
+    Returns a list aligned with `calls` holding each call's result or an RpcError.
+    Raises RpcError if the request as a whole fails (e.g. the provider rejects batches).
+    """
+    headers = {"Content-Type": "application/json"}
+    payload = [
+        {"jsonrpc": "2.0", "id": index, "method": method, "params": params}
+        for index, (method, params) in enumerate(calls)
+    ]
+
+    await rpc_rate_limiter.acquire(len(calls))
+    session = get_http_session()
+    with RPC_SECONDS.time(method="batch"):
+        async with session.post(SOLANA_RPC_URL, headers=headers, json=payload, timeout=RPC_TIMEOUT) as response:
+            if response.status != 200:
+                raise RpcError(f"RPC Error: {response.status}")
+            data = await response.json()
+
+    if not isinstance(data, list):
+        raise RpcError(f"RPC batch rejected: {data.get('error') if isinstance(data, dict) else data}")
+
+    results = [RpcError("Missing response in batch")] * len(calls)
+    for entry in data:
+        index = entry.get("id")
+        if not isinstance(index, int) or not 0 <= index < len(calls):
+            continue
+        if "error" in entry:
+            results[index] = RpcError(f"RPC Error Body: {entry['error']}")
+        else:
+            results[index] = entry.get("result", {})
+    return results
+
+def _parse_asset(item: dict):
+    # Extract relevant info
+    # DAS structure: item['id'] is the mint
+    # item['content']['links']['image'] is the image
+    # item['content']['metadata']['name'] is the name
+    content = item.get("content", {})
+    links = content.get("links", {})
+    metadata = content.get("metadata", {})
+
+    return {
+        "mint": item.get("id"),
+        "name": metadata.get("name", "Unknown"),
+        "image": links.get("image"),
+        "attributes": metadata.get("attributes", [])
+    }
+
+def _asset_query(wallet_address: str, collection_address: str = None):
+    """
+    Returns (method, params) for a wallet lookup, scoped to a collection when an address is given.
+    """
+    if collection_address:
+        return "searchAssets", {
             "ownerAddress": wallet_address,
-            "page": 1,
-            "limit": 1000,
-            "displayOptions": {
-                "showFungible": False
-            }
+            "grouping": ["collection", collection_address],
+        }
+    return "getAssetsByOwner", {
+        "ownerAddress": wallet_address,
+        "displayOptions": {
+            "showFungible": False
         }
     }
 
-    async with aiohttp.ClientSession() as session:
+async def _fetch_page(method: str, params: dict, page: int):
+    result = await _rpc_call(method, {**params, "page": page, "limit": DAS_PAGE_LIMIT})
+    return result.get("items", [])
+
+async def _fetch_remaining_pages(method: str, params: dict, items: list):
+    """
+    Given a full page 1, fetches windows of DAS_PAGE_CONCURRENCY pages concurrently until a short page.
+    """
+    page = 2
+    while page <= DAS_MAX_PAGES:
+        window = range(page, min(page + DAS_PAGE_CONCURRENCY, DAS_MAX_PAGES + 1))
+        pages = await asyncio.gather(*(_fetch_page(method, params, p) for p in window))
+        for page_items in pages:
+            items.extend(page_items)
+            if len(page_items) < DAS_PAGE_LIMIT:
+                return items
+        page += DAS_PAGE_CONCURRENCY
+
+    print(f"Warning: {method} for {params.get('ownerAddress')} stopped at DAS_MAX_PAGES={DAS_MAX_PAGES}")
+    return items
+
+async def _fetch_all_pages(method: str, params: dict):
+    """
+    Fetches every page of a DAS query. Page 1 is fetched alone (most wallets fit in one page).
+    """
+    items = await _fetch_page(method, params, 1)
+    if len(items) < DAS_PAGE_LIMIT:
+        return items
+    return await _fetch_remaining_pages(method, params, items)
+
+def _parse_assets(items: list):
+    assets = []
+    for item in items:
         try:
-            async with session.post(SOLANA_RPC_URL, headers=headers, json=payload) as response:
-                if response.status != 200:
-                    print(f"RPC Error: {response.status}")
-                    return []
-                
-                data = await response.json()
-                if "error" in data:
-                    print(f"RPC Error Body: {data['error']}")
-                    return []
-
-                items = data.get("result", {}).get("items", [])
-                assets = []
-                
-                for item in items:
-                    # Extract relevant info
-                    # DAS structure: item['id'] is the mint
-                    # item['content']['links']['image'] is the image
-                    # item['content']['metadata']['name'] is the name
-                    
-                    try:
-                        content = item.get("content", {})
-                        links = content.get("links", {})
-                        metadata = content.get("metadata", {})
-                        
-                        asset = {
-                            "mint": item.get("id"),
-                            "name": metadata.get("name", "Unknown"),
-                            "image": links.get("image"),
-                            "attributes": metadata.get("attributes", [])
-                        }
-                        assets.append(asset)
-                    except Exception as e:
-                        continue
-                        
-                return assets
+            assets.append(_parse_asset(item))
+        except Exception:
+            continue
+    return assets
 
+async def fetch_assets_by_owner(wallet_address: str, collection_address: str = None):
+    """
+    Fetches assets (NFTs) owned by a wallet using the Metaplex DAS API, following every page.
+    With collection_address, uses searchAssets grouped by collection so only that collection's
+    assets cross the wire; otherwise uses getAssetsByOwner for the whole wallet.
+    Returns a list of asset dictionaries containing mint, name, image_uri, etc.
+    Raises on RPC errors, so an empty list always means the wallet holds nothing.
+    """
+    method, params = _asset_query(wallet_address, collection_address)
+    return _parse_assets(await _fetch_all_pages(method, params))
+
+async def get_assets_by_owner(wallet_address: str, collection_address: str = None):
+    """
+    fetch_assets_by_owner, returning [] on RPC errors.
+    """
+    try:
+        return await fetch_assets_by_owner(wallet_address, collection_address)
+    except Exception as e:
+        print(f"Error in get_assets_by_owner: {e}")
+        return []
+
+async def _fetch_wallet_chunk(wallets: list, collection_address: str, results: dict):
+    queries = [_asset_query(wallet, collection_address) for wallet in wallets]
+    calls = [(method, {**params, "page": 1, "limit": DAS_PAGE_LIMIT}) for method, params in queries]
+
+    try:
+        first_pages = await _rpc_batch_call(calls)
+    except Exception as e:
+        # Provider doesn't accept batch arrays (or the batch failed): fall back to one request per wallet
+        print(f"RPC batch failed ({e}); falling back to per-wallet requests")
+        first_pages = await asyncio.gather(
+            *(_fetch_page(method, params, 1) for method, params in queries), return_exceptions=True
+        )
+        first_pages = [page if isinstance(page, Exception) else {"items": page} for page in first_pages]
+
+    async def finish(wallet, query, first_page):
+        if isinstance(first_page, Exception):
+            results[wallet] = {"assets": [], "error": str(first_page)}
+            return
+        items = first_page.get("items", [])
+        try:
+            if len(items) >= DAS_PAGE_LIMIT:
+                items = await _fetch_remaining_pages(query[0], query[1], items)
+            results[wallet] = {"assets": _parse_assets(items), "error": None}
         except Exception as e:
-            print(f"Error in get_assets_by_owner: {e}")
-            return []
+            results[wallet] = {"assets": [], "error": str(e)}
+
+    await asyncio.gather(*(finish(wallet, query, page) for wallet, query, page in zip(wallets, queries, first_pages)))
+
+async def get_assets_for_wallets(wallet_addresses, collection_address: str = None, batch_size: int = DAS_BATCH_SIZE, concurrency: int = DAS_BATCH_CONCURRENCY):
+    """
+    Fetches assets for many wallets. Page 1 for up to batch_size wallets goes out as one JSON-RPC
+    batch array; wallets with more pages are then paginated individually. At most `concurrency`
+    batches are in flight and all calls go through the shared RPC rate limiter.
+
+    Returns {wallet: {"assets": [...], "error": None or message}}. Unlike get_assets_by_owner, a
+    failed lookup is reported as an error rather than an empty list, so callers can tell
+    "holds nothing" from "lookup failed".
+    """
+    wallets = list(dict.fromkeys(wallet for wallet in wallet_addresses if wallet))
+    results = {}
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run_chunk(chunk):
+        async with semaphore:
+            await _fetch_wallet_chunk(chunk, collection_address, results)
 
+    await asyncio.gather(*(run_chunk(wallets[start:start + batch_size]) for start in range(0, len(wallets), batch_size)))
+    return results
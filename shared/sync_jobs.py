@@ -0,0 +1,296 @@
+import os
+import socket
+import time
+import uuid
+from sqlalchemy import delete, func, select, update
+from shared.database import dialect_insert, get_session, FlexSyncJob, FlexSyncLease
+from shared.repository import run_db
+
+# Persistent state for collection syncs (flex_sync_jobs) and their cross-process leases (flex_sync_leases).
+# sync_collection opens or resumes a job, every batch advances its cursor in the batch's own
+# transaction, and the final status is recorded when the run ends. Syncs run under a lease on
+# their collection; a job still "running" while nobody holds that lease was interrupted (its
+# process died) and is resumed by the sync scheduler.
+
+SYNC_LEASE_TTL = float(os.getenv("SYNC_LEASE_TTL", "120")) # Seconds a lease lasts without renewal
+SYNC_JOB_HISTORY_LIMIT = 10
+
+# Identifies this process as a lease owner
+SYNC_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+RESUMABLE_STATUSES = ("running", "stopped", "failed")
+
+def _job_to_dict(job):
+    return {
+        'id': job.id,
+        'collection_slug': job.collection_slug,
+        'status': job.status,
+        'trigger': job.trigger,
+        'cursor': job.cursor,
+        'last_mint': job.last_mint,
+        'total_items': job.total_items,
+        'processed': job.processed,
+        'inserted': job.inserted,
+        'updated': job.updated,
+        'unchanged': job.unchanged,
+        'active_seconds': job.active_seconds,
+        'resumes': job.resumes,
+        'error': job.error,
+        'started_at': job.started_at,
+        'updated_at': job.updated_at,
+        'finished_at': job.finished_at,
+    }
+
+def _leased_collections(session, now):
+    return set(session.execute(select(FlexSyncLease.collection_slug).where(FlexSyncLease.expires_at > now)).scalars())
+
+def advance_sync_job(session, checkpoint, batch_stats):
+    """
+    Adds a batch's counts to its job and moves the cursor. Runs inside the batch's transaction,
+    so the cursor never gets ahead of (or behind) the rows actually committed.
+    checkpoint: {"job_id", "cursor", "last_mint", "elapsed"}
+    """
+    session.execute(
+        update(FlexSyncJob).where(FlexSyncJob.id == checkpoint["job_id"]).values(
+            cursor=checkpoint["cursor"],
+            last_mint=checkpoint["last_mint"],
+            processed=FlexSyncJob.processed + batch_stats["processed"],
+            inserted=FlexSyncJob.inserted + batch_stats["inserted"],
+            updated=FlexSyncJob.updated + batch_stats["updated"],
+            unchanged=FlexSyncJob.unchanged + batch_stats["unchanged"],
+            active_seconds=FlexSyncJob.active_seconds + checkpoint["elapsed"],
+            updated_at=time.time(),
+        )
+    )
+
+def _start_sync_job(collection_slug, trigger, resume):
+    session = get_session()
+    try:
+        now = time.time()
+        job = None
+        if resume:
+            latest = session.query(FlexSyncJob).filter_by(collection_slug=collection_slug).order_by(FlexSyncJob.id.desc()).first()
+            # Reused even before its first batch committed, so a job cut off at cursor 0 doesn't stay "running"
+            if latest and latest.status in RESUMABLE_STATUSES:
+                job = latest
+                job.resumes += 1
+        if job is None:
+            job = FlexSyncJob(
+                collection_slug=collection_slug, trigger=trigger, cursor=0, processed=0, inserted=0,
+                updated=0, unchanged=0, active_seconds=0.0, resumes=0, started_at=now,
+            )
+            session.add(job)
+        job.status = "running"
+        job.error = None
+        job.finished_at = None
+        job.updated_at = now
+        session.flush()
+        # Only the newest unfinished job is ever resumed; close out older ones so they aren't reported
+        # as interrupted (and resubmitted) forever
+        session.execute(
+            update(FlexSyncJob)
+            .where(FlexSyncJob.collection_slug == collection_slug, FlexSyncJob.id != job.id, FlexSyncJob.status.in_(RESUMABLE_STATUSES))
+            .values(status="superseded", updated_at=now)
+        )
+        session.commit()
+        return _job_to_dict(job)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _reset_sync_job(job_id):
+    session = get_session()
+    try:
+        job = session.get(FlexSyncJob, job_id)
+        job.cursor = 0
+        job.last_mint = None
+        job.processed = job.inserted = job.updated = job.unchanged = 0
+        job.updated_at = time.time()
+        session.commit()
+        return _job_to_dict(job)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _finish_sync_job(job_id, status, error, total_items):
+    session = get_session()
+    try:
+        job = session.get(FlexSyncJob, job_id)
+        now = time.time()
+        job.status = status
+        job.error = error[:500] if error else None
+        job.updated_at = now
+        if status == "completed":
+            job.finished_at = now
+            job.total_items = total_items if total_items is not None else job.cursor
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _get_sync_jobs(collection_slug, limit):
+    session = get_session()
+    try:
+        query = session.query(FlexSyncJob)
+        if collection_slug:
+            query = query.filter_by(collection_slug=collection_slug)
+        jobs = [_job_to_dict(job) for job in query.order_by(FlexSyncJob.id.desc()).limit(limit)]
+        leased = _leased_collections(session, time.time())
+        for job in jobs:
+            job['interrupted'] = job['status'] == "running" and job['collection_slug'] not in leased
+        return jobs
+    finally:
+        session.close()
+
+def _get_interrupted_sync_jobs():
+    session = get_session()
+    try:
+        leased = _leased_collections(session, time.time())
+        jobs = session.query(FlexSyncJob).filter_by(status="running").order_by(FlexSyncJob.id)
+        return [_job_to_dict(job) for job in jobs if job.collection_slug not in leased]
+    finally:
+        session.close()
+
+def _get_last_sync_activity(collection_slugs):
+    session = get_session()
+    try:
+        # A job's last activity: when it completed, else its last checkpoint or status change
+        last_active = func.coalesce(FlexSyncJob.finished_at, FlexSyncJob.updated_at, FlexSyncJob.started_at)
+        return dict(session.execute(
+            select(FlexSyncJob.collection_slug, func.max(last_active))
+            .where(FlexSyncJob.collection_slug.in_(list(collection_slugs)))
+            .group_by(FlexSyncJob.collection_slug)
+        ).all())
+    finally:
+        session.close()
+
+async def start_sync_job(collection_slug: str, trigger: str, resume: bool = True):
+    """
+    With resume, continues the collection's latest job if it never completed; otherwise opens a new
+    one. Older unfinished jobs for the collection are marked "superseded". Returns the job as a dict,
+    marked running.
+    """
+    return await run_db(_start_sync_job, collection_slug, trigger, resume)
+
+async def reset_sync_job(job_id: int):
+    """
+    Rewinds a job to the first item (used when the source no longer matches its cursor).
+    """
+    return await run_db(_reset_sync_job, job_id)
+
+async def finish_sync_job(job_id: int, status: str, error: str = None, total_items: int = None):
+    await run_db(_finish_sync_job, job_id, status, error, total_items)
+
+async def get_sync_jobs(collection_slug: str = None, limit: int = SYNC_JOB_HISTORY_LIMIT):
+    """
+    Most recent jobs first, optionally for one collection.
+    """
+    return await run_db(_get_sync_jobs, collection_slug, limit)
+
+async def get_interrupted_sync_jobs():
+    """
+    Jobs left running by a process that no longer holds their collection's lease.
+    """
+    return await run_db(_get_interrupted_sync_jobs)
+
+async def get_last_sync_activity(collection_slugs):
+    """
+    Returns {collection_slug: when a sync job last finished or made progress}; collections never
+    synced are absent. Unlike started_at, this moves forward when a job is resumed.
+    """
+    return await run_db(_get_last_sync_activity, collection_slugs)
+
+# --- Leases ---
+
+def _acquire_sync_lease(collection_slug, owner, ttl):
+    session = get_session()
+    try:
+        now = time.time()
+        insert = dialect_insert(session)
+        table = FlexSyncLease.__table__
+        stmt = insert(table).values(collection_slug=collection_slug, owner=owner, acquired_at=now, expires_at=now + ttl)
+        excluded = stmt.excluded
+        # Take over only an expired lease (or our own); the row lock makes this atomic across processes
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.collection_slug],
+            set_={"owner": excluded.owner, "acquired_at": excluded.acquired_at, "expires_at": excluded.expires_at},
+            where=(table.c.expires_at < now) | (table.c.owner == owner),
+        ).returning(table.c.owner)
+        acquired = session.execute(stmt).scalar() is not None
+        session.commit()
+        if acquired:
+            return None
+        return session.execute(select(table.c.owner).where(table.c.collection_slug == collection_slug)).scalar()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _renew_sync_lease(collection_slug, owner, ttl):
+    session = get_session()
+    try:
+        result = session.execute(
+            update(FlexSyncLease)
+            .where(FlexSyncLease.collection_slug == collection_slug, FlexSyncLease.owner == owner)
+            .values(expires_at=time.time() + ttl)
+        )
+        session.commit()
+        return result.rowcount == 1
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _release_sync_lease(collection_slug, owner):
+    session = get_session()
+    try:
+        session.execute(delete(FlexSyncLease).where(FlexSyncLease.collection_slug == collection_slug, FlexSyncLease.owner == owner))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+async def acquire_sync_lease(collection_slug: str, owner: str = SYNC_WORKER_ID, ttl: float = SYNC_LEASE_TTL):
+    """
+    Takes the collection's sync lease if it is free or expired. Returns None on success,
+    otherwise the current holder's id.
+    """
+    return await run_db(_acquire_sync_lease, collection_slug, owner, ttl)
+
+async def renew_sync_lease(collection_slug: str, owner: str = SYNC_WORKER_ID, ttl: float = SYNC_LEASE_TTL):
+    """
+    Extends a held lease. Returns False if it was lost (expired and taken by another owner).
+    """
+    return await run_db(_renew_sync_lease, collection_slug, owner, ttl)
+
+async def release_sync_lease(collection_slug: str, owner: str = SYNC_WORKER_ID):
+    await run_db(_release_sync_lease, collection_slug, owner)
+
+def format_sync_job(job):
+    """
+    One-line summary for /admin_sync_history: status, progress, counts and throughput.
+    """
+    status = "interrupted" if job.get('interrupted') else job['status']
+    progress = f"{job['cursor']}/{job['total_items']}" if job['total_items'] else str(job['cursor'])
+    rate = job['processed'] / job['active_seconds'] if job['active_seconds'] else 0.0
+    started = f"<t:{int(job['started_at'])}:R>"
+    line = (
+        f"#{job['id']} `{job['collection_slug']}` {status} ({job['trigger'] or 'manual'}, started {started}): "
+        f"{progress} items, {job['inserted']} inserted, {job['updated']} updated, {job['unchanged']} unchanged, "
+        f"{rate:,.0f} items/s over {job['active_seconds']:.1f}s"
+    )
+    if job['resumes']:
+        line += f", resumed {job['resumes']}x"
+    if job['error']:
+        line += f"\n  Error: {job['error'][:200]}"
+    return line
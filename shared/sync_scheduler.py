@@ -0,0 +1,279 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from shared.collection_sync import CollectionSyncError, format_sync_stats, sync_collection
+from shared.guild_config import get_configured_collections
+from shared.image_cache import schedule_collection_prefetch
+from shared.metrics import Gauge
+from shared.sync_jobs import (
+    SYNC_LEASE_TTL, SYNC_WORKER_ID, acquire_sync_lease, get_interrupted_sync_jobs, get_last_sync_activity,
+    release_sync_lease, renew_sync_lease,
+)
+
+# Collection sync scheduler.
+# Sync requests (admin command, interrupted-job resume, the periodic schedule) are queued by priority
+# and run by SYNC_CONCURRENCY workers, so several collections sync in parallel. Each sync holds the
+# collection's lease (flex_sync_leases) for its whole run, so a second bot replica or
+# scripts/sync_db_manual.py can never sync the same collection at the same time.
+
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "2")) # Collections synced in parallel by this process
+SYNC_INTERVAL_HOURS = float(os.getenv("SYNC_INTERVAL_HOURS", "24")) # Resync configured collections this often (0 disables)
+SYNC_SCHEDULER_TICK = 60 # Seconds between checks for due and interrupted syncs
+
+# Lower runs first
+PRIORITY_ADMIN = 0
+PRIORITY_RESUME = 1
+PRIORITY_SCHEDULE = 2
+
+class SyncLeaseHeld(CollectionSyncError):
+    """
+    Another process (bot replica or sync script) is syncing the collection.
+    """
+    def __init__(self, collection_slug: str, owner: str):
+        super().__init__(f"`{collection_slug}` is already being synced by another process ({owner}).")
+        self.collection_slug = collection_slug
+        self.owner = owner
+
+async def sync_collection_locked(collection_slug: str, should_stop=None, **kwargs):
+    """
+    sync_collection under the collection's lease, renewed in the background while the sync runs.
+    If renewal finds the lease taken over (e.g. this process stalled past SYNC_LEASE_TTL), the sync
+    stops after its current batch. Raises SyncLeaseHeld if another process holds the lease.
+    """
+    owner = await acquire_sync_lease(collection_slug)
+    if owner is not None:
+        raise SyncLeaseHeld(collection_slug, owner)
+
+    lost = False
+
+    async def keep_lease():
+        nonlocal lost
+        while True:
+            await asyncio.sleep(SYNC_LEASE_TTL / 3)
+            try:
+                if not await renew_sync_lease(collection_slug):
+                    print(f"Lost the sync lease for {collection_slug}; stopping the sync.")
+                    lost = True
+                    return
+            except Exception as e:
+                print(f"Sync lease renewal failed for {collection_slug}, will retry: {e}")
+
+    renewer = asyncio.create_task(keep_lease())
+    try:
+        return await sync_collection(collection_slug, should_stop=lambda: lost or bool(should_stop and should_stop()), **kwargs)
+    finally:
+        renewer.cancel()
+        try:
+            await release_sync_lease(collection_slug)
+        except Exception as e:
+            print(f"Sync lease release failed for {collection_slug} (it will expire): {e}")
+
+class SyncRequest:
+    """
+    One queued or running sync. `future` resolves to the sync stats, or raises its error.
+    """
+    def __init__(self, collection_slug: str, priority: int, trigger: str, resume: bool, on_progress):
+        self.collection_slug = collection_slug
+        self.priority = priority
+        self.trigger = trigger
+        self.resume = resume
+        self.on_progress = on_progress
+        self.stop_requested = False
+        self.started_at = None
+        self.future = asyncio.get_running_loop().create_future()
+        self.future.add_done_callback(self._log_result)
+
+    def _log_result(self, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, SyncLeaseHeld):
+            print(f"Sync of {self.collection_slug} skipped: {error}")
+        elif error is not None:
+            print(f"Sync of {self.collection_slug} ({self.trigger}) failed: {error}")
+
+class SyncScheduler:
+    """
+    Priority queue of collection syncs with at most `concurrency` running at once, one per collection.
+    """
+    def __init__(self, concurrency: int, interval_hours: float, tick: float):
+        self.concurrency = max(concurrency, 1)
+        self.interval = interval_hours * 3600
+        self.tick = tick
+        self._queue = [] # (priority, seq, collection_slug); superseded entries are skipped
+        self._seq = itertools.count()
+        self._pending = {} # collection_slug -> (seq, SyncRequest)
+        self._running = {} # collection_slug -> SyncRequest
+        self._wakeup = asyncio.Event()
+        self._workers = []
+        self._ticker = None
+        self.completed = 0
+        self.stopped = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def is_active(self, collection_slug: str):
+        return collection_slug in self._running or collection_slug in self._pending
+
+    def pending(self):
+        return len(self._pending)
+
+    def running(self):
+        return len(self._running)
+
+    def submit(self, collection_slug: str, priority: int, trigger: str, resume: bool = True, on_progress=None):
+        """
+        Queues a sync and returns its SyncRequest. A collection already running or queued returns the
+        existing request instead (a queued one moves up if the new priority is higher).
+        """
+        request = self._running.get(collection_slug)
+        if request is not None:
+            return request
+
+        if collection_slug in self._pending:
+            _, request = self._pending[collection_slug]
+            if priority >= request.priority:
+                return request
+            request.priority = priority
+        else:
+            request = SyncRequest(collection_slug, priority, trigger, resume, on_progress)
+
+        seq = next(self._seq)
+        self._pending[collection_slug] = (seq, request)
+        heapq.heappush(self._queue, (priority, seq, collection_slug))
+        self._wakeup.set()
+        return request
+
+    def stop_sync(self, collection_slug: str = None):
+        """
+        Stops running syncs after their current batch (they can be resumed) and drops queued ones,
+        for one collection or all of them. Returns (stopped, dropped) counts.
+        """
+        stopped = 0
+        for slug, request in self._running.items():
+            if collection_slug in (None, slug) and not request.stop_requested:
+                request.stop_requested = True
+                stopped += 1
+
+        return stopped, self._drop_pending(collection_slug)
+
+    def _drop_pending(self, collection_slug: str = None):
+        dropped = [slug for slug in self._pending if collection_slug in (None, slug)]
+        for slug in dropped:
+            _, request = self._pending.pop(slug)
+            request.future.set_exception(CollectionSyncError(f"Queued sync of `{slug}` was cancelled."))
+        return len(dropped)
+
+    async def _next_request(self):
+        while True:
+            while self._queue:
+                _, seq, collection_slug = heapq.heappop(self._queue)
+                entry = self._pending.get(collection_slug)
+                if entry is not None and entry[0] == seq:
+                    del self._pending[collection_slug]
+                    return entry[1]
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _run_request(self, request: SyncRequest):
+        collection_slug = request.collection_slug
+        self._running[collection_slug] = request
+        request.started_at = time.time()
+        try:
+            stats = await sync_collection_locked(
+                collection_slug, should_stop=lambda: request.stop_requested, on_progress=request.on_progress,
+                trigger=request.trigger, resume=request.resume,
+            )
+        except asyncio.CancelledError:
+            request.future.cancel()
+            raise
+        except SyncLeaseHeld as e:
+            self.skipped += 1
+            request.future.set_exception(e)
+        except Exception as e:
+            self.failed += 1
+            request.future.set_exception(e)
+        else:
+            if stats["stopped"]:
+                self.stopped += 1
+            else:
+                self.completed += 1
+                print(f"Sync finished for {collection_slug} ({request.trigger}): {format_sync_stats(stats)}.")
+                # Warm the local artwork cache so /flex never waits on IPFS/Arweave gateways
+                schedule_collection_prefetch(collection_slug)
+            request.future.set_result(stats)
+        finally:
+            del self._running[collection_slug]
+
+    async def _work(self):
+        while True:
+            request = await self._next_request()
+            await self._run_request(request)
+
+    async def check_due(self):
+        """
+        Queues interrupted jobs for resume, and configured collections whose last sync finished (or
+        last made progress) more than the interval ago, or that were never synced.
+        """
+        for job in await get_interrupted_sync_jobs():
+            if not self.is_active(job['collection_slug']):
+                print(f"Resuming interrupted sync job #{job['id']} for {job['collection_slug']}.")
+                self.submit(job['collection_slug'], PRIORITY_RESUME, trigger="resume")
+
+        if self.interval <= 0:
+            return
+        collection_slugs = get_configured_collections()
+        last_active = await get_last_sync_activity(collection_slugs)
+        due_before = time.time() - self.interval
+        for collection_slug in collection_slugs:
+            if last_active.get(collection_slug, 0) < due_before and not self.is_active(collection_slug):
+                print(f"Scheduling sync of {collection_slug}.")
+                self.submit(collection_slug, PRIORITY_SCHEDULE, trigger="schedule")
+
+    async def _run_ticks(self):
+        while True:
+            try:
+                await self.check_due()
+            except Exception as e:
+                print(f"Error checking for due syncs: {e}")
+            await asyncio.sleep(self.tick)
+
+    def start(self, schedule: bool = True):
+        """
+        Starts the workers and, with schedule, the periodic check for due and interrupted syncs.
+        """
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        if schedule and self._ticker is None:
+            self._ticker = asyncio.create_task(self._run_ticks())
+
+    async def stop(self):
+        """
+        Cancels the workers and drops the queue. Running jobs stay "running" with their lease
+        released, so whichever process checks next resumes them from their last committed batch.
+        """
+        self._drop_pending()
+        tasks = self._workers + ([self._ticker] if self._ticker else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._ticker = None
+
+    def stats(self):
+        return {
+            "worker": SYNC_WORKER_ID,
+            "concurrency": self.concurrency,
+            "running": ", ".join(sorted(self._running)) or "none",
+            "pending": self.pending(),
+            "completed": self.completed,
+            "stopped": self.stopped,
+            "failed": self.failed,
+            "skipped (leased elsewhere)": self.skipped,
+        }
+
+sync_scheduler = SyncScheduler(SYNC_CONCURRENCY, SYNC_INTERVAL_HOURS, SYNC_SCHEDULER_TICK)
+Gauge("flexbot_syncs_running", "Collection syncs running in this process", callback=sync_scheduler.running)
+Gauge("flexbot_syncs_pending", "Collection syncs queued in this process", callback=sync_scheduler.pending)
@@ -0,0 +1,106 @@
+import bisect
+import os
+import time
+from collections import OrderedDict
+from shared.metrics import Gauge
+
+# Per-wallet in-memory trait index for /flex autocomplete.
+# Built once from the trait table and kept for TRAIT_INDEX_TTL seconds (or until ownership changes),
+# so each keystroke is a bisect over a sorted list instead of a database round trip.
+
+TRAIT_INDEX_TTL = float(os.getenv("TRAIT_INDEX_TTL", "300"))
+TRAIT_INDEX_MAX_WALLETS = int(os.getenv("TRAIT_INDEX_MAX_WALLETS", "5000"))
+
+class TraitIndex:
+    """
+    Sorted "Trait: Value" labels with per-label NFT counts.
+    Prefix lookups bisect a lowercase-sorted array; matches are ranked by how many NFTs carry the trait.
+    """
+    def __init__(self, trait_counts):
+        entries = sorted(
+            (f"{trait_type}: {value}".lower(), f"{trait_type}: {value}", count)
+            for trait_type, value, count in trait_counts
+        )
+        self._keys = [key for key, _, _ in entries]
+        self._labels = [label for _, label, _ in entries]
+        self._counts = [count for _, _, count in entries]
+        # Ranking for empty input: most-held traits first
+        self._by_count = sorted(range(len(entries)), key=lambda i: (-self._counts[i], self._keys[i]))
+        # Also index the value part ("Red" in "Hat: Red") so typing a value prefix works
+        value_entries = sorted((label.split(": ", 1)[-1].lower(), i) for i, label in enumerate(self._labels))
+        self._value_keys = [key for key, _ in value_entries]
+        self._value_positions = [i for _, i in value_entries]
+
+    def __len__(self):
+        return len(self._labels)
+
+    def _prefix_range(self, keys, prefix):
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + "\uffff")
+        return range(start, end)
+
+    def search(self, query: str, limit: int = 25):
+        """
+        Returns up to `limit` (label, count) pairs. Prefix matches on the whole label or on the value
+        come first, then substring matches; each group is ordered by count, highest first.
+        """
+        query = query.strip().lower()
+        if not query:
+            return [(self._labels[i], self._counts[i]) for i in self._by_count[:limit]]
+
+        prefix_hits = set(self._prefix_range(self._keys, query))
+        prefix_hits.update(self._value_positions[i] for i in self._prefix_range(self._value_keys, query))
+        ranked = sorted(prefix_hits, key=lambda i: (-self._counts[i], self._keys[i]))
+
+        if len(ranked) < limit:
+            # Substring fallback is a linear scan, but only over this wallet's distinct traits
+            substring_hits = [i for i in self._by_count if i not in prefix_hits and query in self._keys[i]]
+            ranked.extend(substring_hits)
+
+        return [(self._labels[i], self._counts[i]) for i in ranked[:limit]]
+
+class TraitIndexCache:
+    """
+    LRU of TraitIndex objects keyed by (wallet, collection), expiring after `ttl` seconds.
+    """
+    def __init__(self, ttl: float, max_wallets: int):
+        self.ttl = ttl
+        self.max_wallets = max_wallets
+        self._entries = OrderedDict() # (wallet, collection_slug) -> (expires_at, TraitIndex)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, wallet_address: str, collection_slug: str):
+        key = (wallet_address, collection_slug)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, wallet_address: str, collection_slug: str, index: TraitIndex):
+        key = (wallet_address, collection_slug)
+        self._entries[key] = (time.monotonic() + self.ttl, index)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_wallets:
+            self._entries.popitem(last=False)
+
+    def invalidate_wallet(self, wallet_address: str):
+        if not wallet_address:
+            return
+        for key in [key for key in self._entries if key[0] == wallet_address]:
+            del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+trait_index_cache = TraitIndexCache(TRAIT_INDEX_TTL, TRAIT_INDEX_MAX_WALLETS)
+Gauge("flexbot_trait_index_hit_ratio", "Trait index cache hits per lookup", callback=lambda: trait_index_cache.stats()["hit_rate"])